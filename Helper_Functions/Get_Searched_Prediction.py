@@ -8,22 +8,28 @@ a predicted price range.
 
 Requirements:
 - Player data must be provided from a CSV file 
-- Centroids and label files must be precomputed (from kmeans.py output)
+- A model file (model_artifact.py) or centroids and label files must be precomputed (from kmeans.py output)
 
 Authors: Logan Seitz, Marcos Wofford, Joseph Saunderson
 """
 
-import csv
 import os
 
+import numpy as np
+
+from feature_registry import DEFAULT_FEATURES, feature_vector
+from model_artifact import load_model
+from player_index import load_player_index
+from range_index import RangeIndex
+
+def find_player_rows(database_file, player_name):
+    """Returns the dictionaries of every player row whose name matches, ignoring case, accents and spacing."""
+    return load_player_index(database_file).lookup(player_name)
+
 def find_player_row(database_file, player_name):
     """Returns the dictionary of the player row if a matching name is found."""
-    with open(database_file, 'r') as f:
-        reader = csv.DictReader(f)
-        for row in reader:
-            if row['name'] == player_name:
-                return row
-    return None
+    rows = find_player_rows(database_file, player_name)
+    return rows[0] if rows else None
 
 def euclidean_distance(point1, point2):
     """Computes the Euclidean distance between two vectors."""
@@ -38,12 +44,12 @@ def Get_Predicted_Range(centroids_file, centroid_labels_file, ranges, player_dic
     finds the closest one, and returns the price range mapped to that cluster.
     """
     # Features used in clustering (must match centroid structure)
-    featureList = ['Age', 'time', 'xA', 'xG']
+    featureList = DEFAULT_FEATURES
 
     try:
 
-        # Convert selected player features to float
-        playerFeatures = [float(player_dict[word]) for word in featureList]
+        # Compute the selected player features as float (see feature_registry.py)
+        playerFeatures = feature_vector(player_dict, featureList).tolist()
     except:
         print("The player's data is insufficient for prediction")
         return None
@@ -66,39 +72,52 @@ def Get_Predicted_Range(centroids_file, centroid_labels_file, ranges, player_dic
         with open(centroid_labels_file, 'r') as clf:
             labelList = clf.readlines()
             label = labelList[CentroidIndex]
-            with open(ranges, 'r') as r:
-                rangeList = r.readlines()
-                for item in rangeList:
-                    items = item.split()
-                    if float(items[0]) < float(label) <float(items[1]):
-                        rawRange = items
-                    #if label[0:5] == item[0:5]:
-                        #rawRange = item.split()
-
-        # Extracting and scaling lower range
-        rawRangeLower = rawRange[0]
-        rangeLower = float(rawRangeLower[0:4])
-        if rawRangeLower[-1] == '5':
-            rangeLower *= 0.1
-        elif rawRangeLower[-1] == '7':
-            rangeLower *= 10
-        elif rawRangeLower[-1] == '8':
-            rangeLower *= 100
-
-        # Extracting and scaling upper range
-        rawRangeUpper = rawRange[1]
-        rangeUpper = float(rawRangeUpper[0:4])
-        if rawRangeUpper[-1] == '5':
-            rangeUpper *= 0.1
-        elif rawRangeUpper[-1] == '7':
-            rangeUpper *= 10
-        elif rawRangeUpper[-1] == '8':
-            rangeUpper *= 100
+
+        # Find the range the label falls in, a label on a range edge belongs to the range it starts
+        lower, upper = RangeIndex.from_file(ranges).bounds(float(label))
+        if np.isnan(lower):
+            raise ValueError(f"Cluster label {label.strip()} is outside every price range")
+
+        # Ranges are stored in euros, predictions are shown in millions
+        rangeLower = round(float(lower) / 1e6, 3)
+        rangeUpper = round(float(upper) / 1e6, 3)
 
         # Returning all relevant prediction data
         closest_centroid = centroid_vector_list[CentroidIndex]
         return closest_centroid, CentroidFileLine, label, rangeLower, rangeUpper
 
+def Get_Predicted_Range_From_Model(model, player_dict):
+    """
+    Same as Get_Predicted_Range, but uses a model loaded with model_artifact.load_model
+    instead of re-reading the centroid, label and range files.
+    """
+    try:
+
+        # Compute the player's features, in the order the model was trained on
+        playerFeatures = feature_vector(player_dict, model["features"])
+    except:
+        print("The player's data is insufficient for prediction")
+        return None
+
+    # Find index of closest centroid, in the feature scaling the model was trained with
+    distances = np.linalg.norm(model["centroids"] - model["scaler"].transform(playerFeatures), axis=1)
+    CentroidIndex = int(np.argmin(distances))
+    CentroidFileLine = CentroidIndex + 1
+
+    # Get label of the matched centroid and the range it falls in
+    label = model["cluster_labels"][CentroidIndex]
+    lower, upper = RangeIndex(model["range_edges"]).bounds(label)
+    if np.isnan(lower):
+        raise ValueError(f"Cluster label {label} is outside every price range")
+
+    # Ranges are stored in euros, predictions are shown in millions
+    rangeLower = round(float(lower) / 1e6, 3)
+    rangeUpper = round(float(upper) / 1e6, 3)
+
+    # Returning all relevant prediction data
+    closest_centroid = model["scaler"].inverse_transform(model["centroids"][CentroidIndex]).tolist()
+    return closest_centroid, CentroidFileLine, str(label), rangeLower, rangeUpper
+
 def save_prediction_to_txt(player_name, player_row, label, centroid, line_number, lower, upper):
     """Saves player stats and predicted price range to a formatted .txt file."""
     filename = f"{player_name.replace(' ', '_')}_prediction.txt"
@@ -135,11 +154,29 @@ def main():
 
     # Prompting user for player name
     searched_player = input("Enter a player name to predict their transfer price: ").strip()
-    player_row = find_player_row(db_file, searched_player)
-    if player_row is None:
+    player_rows = find_player_rows(db_file, searched_player)
+    if not player_rows:
         print(f" Player '{searched_player}' not found in {db_file}")
+        suggestions = load_player_index(db_file).suggest(searched_player)
+        if suggestions:
+            print(" Did you mean: " + ", ".join(suggestions))
         return
 
+    # Letting the user pick when several players share the name
+    player_row = player_rows[0]
+    if len(player_rows) > 1:
+        print(f"{len(player_rows)} players match '{searched_player}':")
+        for i, row in enumerate(player_rows, start=1):
+            print(f"  {i}. {row['name']} ({row.get('Team') or row.get('team') or 'unknown team'}, age {row.get('Age') or '?'})")
+        choice = input("Enter the number of the player: ").strip()
+        if not choice.isdigit() or not 1 <= int(choice) <= len(player_rows):
+            print("Invalid choice, please try again")
+            return
+        player_row = player_rows[int(choice) - 1]
+
+    # Model file bundling centroids, labels and ranges, used when present
+    default_model = "model_31_65.npz"
+
     # Prompting user for necessary model files
     default_centroids = "centroids31_65.txt"
     default_labels = "cluster_labels_31_65.txt"
@@ -149,23 +186,36 @@ def main():
     labels_file = default_labels
     ranges_file = default_ranges
 
-    # Making sure files exist
-    for file in [centroids_file, labels_file, ranges_file]:
-        if not os.path.exists(file):
-            print(f" Required file not found: {file}")
-            return
-    try:
+    if os.path.exists(default_model):
+        try:
 
-        # Predicting price range
-        centroid, line_num, label, low, high = Get_Predicted_Range(
-            centroids_file,
-            labels_file,
-            ranges_file,
-            player_row
-        )
-    except:
-        print("Ending program now, please try another player")
-        return
+            # Predicting price range from the model file
+            centroid, line_num, label, low, high = Get_Predicted_Range_From_Model(
+                load_model(default_model),
+                player_row
+            )
+        except:
+            print("Ending program now, please try another player")
+            return
+    else:
+
+        # Making sure files exist
+        for file in [centroids_file, labels_file, ranges_file]:
+            if not os.path.exists(file):
+                print(f" Required file not found: {file}")
+                return
+        try:
+
+            # Predicting price range
+            centroid, line_num, label, low, high = Get_Predicted_Range(
+                centroids_file,
+                labels_file,
+                ranges_file,
+                player_row
+            )
+        except:
+            print("Ending program now, please try another player")
+            return
 
     # Printing results
     # print(f"\nThis is the Label: {label.strip()}")
@@ -175,4 +225,5 @@ def main():
     # Saving results to file
     save_prediction_to_txt(searched_player, player_row, label, centroid, line_num, low, high)
 
-main()
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,169 @@
+"""
+Feature Registry
+
+The one place that defines the features a player is clustered on. Every feature is
+declared once with the scraped columns it reads and a vectorized function that computes
+it for a whole table at a time:
+
+    raw            a scraped number as it is (Age, time, xG, ...)
+    per 90         a scraped total per 90 minutes played (xG_per90 = xG / time * 90)
+    contract       years from the market value date to the contract expiration
+    position       1 or 0 for each position group (GK, DF, MF, FW) of the Transfermarkt position
+
+A feature set is an ordered list of feature names. data_sort.py writes the columns of a
+set in its order, and the model file stores the names (model_artifact.py), so the
+predictors compute the same features in the same order for a player. The default set is
+the four features the models were always trained on, so existing files stay valid.
+
+Adding a feature means adding it to FEATURE_REGISTRY (and to a set); nothing else changes.
+
+Authors: Logan Seitz, Marcos Wofford, Joseph Saunderson
+"""
+
+import numpy as np
+import pandas as pd
+
+class Feature:
+    """A named feature, the scraped columns it reads and the function computing it."""
+
+    def __init__(self, name, inputs, compute, text_inputs=()):
+        self.name = name
+        self.inputs = tuple(inputs)             # numeric columns, read as float
+        self.text_inputs = tuple(text_inputs)   # text columns (dates, positions), read as str
+        self.compute = compute                  # table -> float Series, nan where unknown
+
+    def __repr__(self):
+        return f"Feature({self.name!r})"
+
+def numeric(table, column):
+    """A column as floats, nan where it is missing or not a number."""
+    return pd.to_numeric(table[column], errors='coerce').astype(float)
+
+def raw(column):
+    """A scraped number used as it is."""
+    return Feature(column, [column], lambda table: numeric(table, column))
+
+def per90(column, minutes='time'):
+    """A scraped total per 90 minutes played, nan for players without minutes."""
+    def compute(table):
+        played = numeric(table, minutes)
+        return (numeric(table, column) / played * 90).where(played > 0)
+    return Feature(f"{column}_per90", [column, minutes], compute)
+
+# Contract and market value dates are written like 'Jun 30, 2028'
+DATE_FORMAT = '%b %d, %Y'
+
+def years_until(column, since='Value last updated', name='years_to_contract_end'):
+    """
+    Years from the market value date to a date column, nan if either date is unknown,
+    so the same table always gives the same features whenever it is processed.
+    """
+    def compute(table):
+        end = pd.to_datetime(table[column], format=DATE_FORMAT, errors='coerce')
+        start = pd.to_datetime(table[since], format=DATE_FORMAT, errors='coerce')
+        return ((end - start).dt.days / 365.25).astype(float)
+    return Feature(name, [], compute, text_inputs=[column, since])
+
+# Position group -> words of the Transfermarkt positions in it, e.g. 'Centre-Back' -> DF
+POSITION_GROUPS = {
+    'GK': ('goalkeeper',),
+    'DF': ('back', 'defender', 'sweeper'),
+    'MF': ('midfield',),
+    'FW': ('winger', 'forward', 'striker'),
+}
+
+def position_group(column, group):
+    """1 if the player's position is in the group, 0 if it is in another group, nan if unknown."""
+    pattern = '|'.join(POSITION_GROUPS[group])
+    def compute(table):
+        positions = table[column].astype('string').str.lower()
+        known = positions.str.contains('|'.join(sum(POSITION_GROUPS.values(), ())), regex=True)
+        in_group = positions.str.contains(pattern, regex=True)
+        return in_group.astype('Float64').where(known.fillna(False)).astype(float)
+    return Feature(f"position_{group}", [], compute, text_inputs=[column])
+
+# Every feature that can be used, by name
+FEATURE_REGISTRY = {feature.name: feature for feature in [
+    raw('Age'),
+    raw('time'),
+    raw('xA'),
+    raw('xG'),
+    raw('npxG'),
+    raw('xGChain'),
+    raw('xGBuildup'),
+    raw('key_passes'),
+    raw('shots'),
+    per90('xG'),
+    per90('xA'),
+    per90('npxG'),
+    per90('xGChain'),
+    per90('xGBuildup'),
+    per90('key_passes'),
+    per90('shots'),
+    years_until('Contract expiration'),
+    *(position_group('Position', group) for group in POSITION_GROUPS),
+]}
+
+# Ordered feature lists, the order of the clustered columns and of the model's centroids
+FEATURE_SETS = {
+    'default': ['Age', 'time', 'xA', 'xG'],
+    'extended': ['Age', 'time', 'xG_per90', 'xA_per90', 'npxG_per90', 'xGChain_per90', 'xGBuildup_per90',
+                 'key_passes_per90', 'shots_per90', 'years_to_contract_end',
+                 'position_GK', 'position_DF', 'position_MF', 'position_FW'],
+}
+
+DEFAULT_FEATURES = FEATURE_SETS['default']
+
+def resolve_features(features=None):
+    """
+    Returns the Feature objects of a feature set name or list of feature names,
+    the default set for None. Raises ValueError for unknown names.
+    """
+    if features is None:
+        features = DEFAULT_FEATURES
+    elif isinstance(features, str):
+        if features not in FEATURE_SETS:
+            raise ValueError(f"Unknown feature set '{features}', expected one of {', '.join(FEATURE_SETS)}")
+        features = FEATURE_SETS[features]
+
+    unknown = [name for name in features if name not in FEATURE_REGISTRY]
+    if unknown:
+        raise ValueError(f"Unknown features {', '.join(unknown)}, see FEATURE_REGISTRY in feature_registry.py")
+    return [FEATURE_REGISTRY[name] for name in features]
+
+def feature_names(features=None):
+    """Names of a feature set, in column order."""
+    return [feature.name for feature in resolve_features(features)]
+
+def input_dtypes(features=None):
+    """Scraped columns the features read -> dtype to read them with (float or str)."""
+    dtypes = {}
+    for feature in resolve_features(features):
+        dtypes.update({column: float for column in feature.inputs})
+        dtypes.update({column: str for column in feature.text_inputs})
+    return dtypes
+
+def compute_features(table, features=None):
+    """
+    Computes the features of every row of a table in one pass over its columns.
+    Input columns missing from the table count as missing values.
+
+    Returns:
+        pd.DataFrame: One float column per feature, in feature set order, nan where
+        a feature could not be computed.
+    """
+    missing = [column for column in input_dtypes(features) if column not in table]
+    if missing:
+        table = table.assign(**{column: np.nan for column in missing})
+    return pd.DataFrame({feature.name: feature.compute(table) for feature in resolve_features(features)},
+                        index=table.index)
+
+def feature_vector(row, features=None):
+    """
+    Computes the features of a single player row, e.g. a dictionary of scraped values.
+    Raises ValueError if any feature is missing.
+    """
+    values = compute_features(pd.DataFrame([row]), features).to_numpy()[0]
+    if np.isnan(values).any():
+        raise ValueError("The player's data is missing features")
+    return values
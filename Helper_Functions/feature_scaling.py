@@ -0,0 +1,79 @@
+"""
+Feature Scaling
+
+The clustered features sit on very different scales: minutes played reach the thousands
+while xG and xA are single digits, so an unscaled Euclidean distance is decided almost
+entirely by minutes. A FeatureScaler is fitted once on the records and maps every
+feature to a comparable scale, then multiplies it by a per-feature weight:
+
+    scaled = (value - center) / scale * weight
+
+    none     center 0, scale 1 (only the weights apply)
+    zscore   mean and standard deviation
+    robust   median and interquartile range, less pulled by a few extreme players
+    minmax   minimum and range, every feature between 0 and 1
+
+The fitted parameters are stored in the model artifact (model_artifact.py), so the
+predictor scales a player's features exactly as the records were scaled.
+
+Authors: Logan Seitz, Marcos Wofford, Joseph Saunderson
+"""
+
+import numpy as np
+
+SCALING_METHODS = ("none", "zscore", "robust", "minmax")
+
+class FeatureScaler:
+    """Fitted center, scale and weight of every feature."""
+
+    def __init__(self, center, scale, weights=None, method="none"):
+        self.center = np.asarray(center, dtype=float).ravel()
+        self.scale = np.asarray(scale, dtype=float).ravel()
+        self.weights = np.ones_like(self.center) if weights is None else np.asarray(weights, dtype=float).ravel()
+        self.method = method
+        if not (len(self.center) == len(self.scale) == len(self.weights)):
+            raise ValueError("center, scale and weights need one value per feature")
+        if np.any(self.scale <= 0) or np.any(self.weights < 0):
+            raise ValueError("Feature scales must be positive and weights not negative")
+
+    @classmethod
+    def identity(cls, n_features):
+        """Scaler that leaves every feature unchanged."""
+        return cls(np.zeros(n_features), np.ones(n_features))
+
+    @classmethod
+    def fit(cls, features, method="zscore", weights=None):
+        """
+        Fits a scaler to the rows of a records x features matrix.
+
+        Args:
+            features (np.ndarray): Training features, without the label column.
+            method (str): One of SCALING_METHODS.
+            weights (list of float or None): Weight of every feature, 1 for all if None.
+        """
+        features = np.asarray(features, dtype=float)
+        if method == "none":
+            center, scale = np.zeros(features.shape[1]), np.ones(features.shape[1])
+        elif method == "zscore":
+            center, scale = features.mean(axis=0), features.std(axis=0)
+        elif method == "robust":
+            q1, center, q3 = np.percentile(features, [25, 50, 75], axis=0)
+            scale = q3 - q1
+        elif method == "minmax":
+            center = features.min(axis=0)
+            scale = features.max(axis=0) - center
+        else:
+            raise ValueError(f"Unknown scaling method '{method}', expected one of {', '.join(SCALING_METHODS)}")
+
+        # A constant feature carries no distance, keep it instead of dividing by zero
+        scale = np.where(scale > 0, scale, 1.0)
+        return cls(center, scale, weights, method)
+
+    def transform(self, features):
+        """Scales the rows of a matrix (or a single feature vector)."""
+        return (np.asarray(features, dtype=float) - self.center) / self.scale * self.weights
+
+    def inverse_transform(self, scaled):
+        """Maps scaled rows back to the original units (features with weight 0 come back as their center)."""
+        weights = np.where(self.weights > 0, self.weights, 1.0)
+        return np.asarray(scaled, dtype=float) / weights * self.scale + self.center
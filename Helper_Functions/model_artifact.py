@@ -0,0 +1,144 @@
+"""
+Model Artifact
+
+Stores everything a trained price model needs in a single .npz file: the centroid
+matrix, the label of every centroid, the price range edges, the feature order the
+centroids were trained on, the fitted feature scaling (feature_scaling.py), k, the
+seed of the sweep and the validation score. Centroids are stored in the scaled space.
+
+Before, a model was three loose text files (centroids, cluster labels and ranges)
+that had to be parsed line by line on every prediction and could be mixed up between
+runs. An artifact is written once after kmeans and loaded in one binary read.
+
+Usage:
+    python model_artifact.py centroids31_65.txt cluster_labels_31_65.txt ranges.txt model_31_65.npz --score 18
+
+Authors: Logan Seitz, Marcos Wofford, Joseph Saunderson
+"""
+
+import argparse
+import os
+
+import numpy as np
+
+from feature_registry import DEFAULT_FEATURES, FEATURE_SETS, feature_names
+from feature_scaling import FeatureScaler
+from range_index import RangeIndex
+
+# Bumped whenever the arrays stored in the artifact change
+FORMAT_VERSION = 2
+
+# Older versions that can still be loaded, version 1 has no feature scaling
+SUPPORTED_VERSIONS = (1, 2)
+
+# Features used in clustering by default, in the column order of the centroids (see feature_registry.py)
+FEATURES = DEFAULT_FEATURES
+
+def save_model(path, centroids, cluster_labels, range_edges, features=FEATURES, seed=None, score=None, scaler=None):
+    """
+    Writes a model artifact.
+
+    Args:
+        path (str): Output .npz file.
+        centroids (np.ndarray): k x len(features) centroid matrix.
+        cluster_labels (np.ndarray): Price label of every centroid.
+        range_edges (np.ndarray): Sorted edges of the price ranges.
+        features (list of str): Feature order of the centroid columns.
+        seed (int or None): Seed of the sweep that produced the model.
+        score (float or None): Validation score of the model.
+        scaler (FeatureScaler or None): Scaling the centroids were trained in, None for unscaled features.
+    """
+    centroids = np.asarray(centroids, dtype=float)
+    scaler = scaler or FeatureScaler.identity(centroids.shape[1])
+    cluster_labels = np.asarray(cluster_labels, dtype=float).ravel()
+    range_edges = np.asarray(range_edges, dtype=float).ravel()
+
+    model = {
+        "format_version": np.int64(FORMAT_VERSION),
+        "centroids": centroids,
+        "cluster_labels": cluster_labels,
+        "range_edges": range_edges,
+        "features": np.array(features, dtype=str),
+        "k": np.int64(len(centroids)),
+        "seed": np.int64(-1 if seed is None else seed),
+        "score": np.float64(np.nan if score is None else score),
+        "scaling_method": np.array(scaler.method, dtype=str),
+        "feature_center": scaler.center,
+        "feature_scale": scaler.scale,
+        "feature_weights": scaler.weights,
+    }
+    check_model(model)
+
+    # Write next to the target and rename, so a reader never sees half a file
+    tmp_path = path + ".tmp"
+    with open(tmp_path, 'wb') as f:
+        np.savez(f, **model)
+    os.replace(tmp_path, path)
+
+def check_model(model):
+    """Raises ValueError if the arrays of a model do not belong together."""
+    if int(model["format_version"]) not in SUPPORTED_VERSIONS:
+        raise ValueError(f"Unsupported model format version {int(model['format_version'])}, expected {FORMAT_VERSION}")
+
+    k = int(model["k"])
+    centroids = model["centroids"]
+    if centroids.ndim != 2 or centroids.shape[0] != k or centroids.shape[1] != len(model["features"]):
+        raise ValueError(f"Centroid matrix of shape {centroids.shape} does not match k={k} "
+                         f"and {len(model['features'])} features")
+    if len(model["cluster_labels"]) != k:
+        raise ValueError(f"{len(model['cluster_labels'])} cluster labels for k={k} centroids")
+    RangeIndex(model["range_edges"])
+    if int(model["format_version"]) >= 2:
+        scaler = FeatureScaler(model["feature_center"], model["feature_scale"], model["feature_weights"])
+        if len(scaler.center) != len(model["features"]):
+            raise ValueError(f"Feature scaling of {len(scaler.center)} features for {len(model['features'])} features")
+
+def load_model(path):
+    """
+    Loads a model artifact written by save_model.
+
+    Returns:
+        dict: The arrays of the model, with "features" as a list of str,
+        "k", "seed" and "score" as Python numbers (seed None and score nan if unknown)
+        and "scaler" as a FeatureScaler (unscaled for version 1 files).
+    """
+    with np.load(path, allow_pickle=False) as f:
+        model = {name: f[name] for name in f.files}
+    check_model(model)
+
+    model["features"] = [str(feature) for feature in model["features"]]
+    model["k"] = int(model["k"])
+    model["seed"] = None if int(model["seed"]) < 0 else int(model["seed"])
+    model["score"] = float(model["score"])
+    if int(model["format_version"]) >= 2:
+        model["scaler"] = FeatureScaler(model["feature_center"], model["feature_scale"], model["feature_weights"],
+                                        str(model["scaling_method"]))
+    else:
+        model["scaler"] = FeatureScaler.identity(len(model["features"]))
+    return model
+
+def main():
+    """Builds an artifact from the text files of a kmeans run."""
+    parser = argparse.ArgumentParser(description="Bundle centroid, cluster label and range files into one model file.")
+    parser.add_argument("centroids", help="centroid file written by kmeans.py")
+    parser.add_argument("labels", help="cluster label file written by kmeans.py")
+    parser.add_argument("ranges", help="ranges.txt written by final_prep.py")
+    parser.add_argument("output", help="model file to write (.npz)")
+    parser.add_argument("--seed", type=int, default=None, help="seed of the sweep")
+    parser.add_argument("--score", type=float, default=None, help="validation score of the run")
+    parser.add_argument("--features", choices=FEATURE_SETS, default="default", help="feature set the centroids were trained on")
+    args = parser.parse_args()
+
+    save_model(
+        args.output,
+        np.loadtxt(args.centroids, ndmin=2),
+        np.loadtxt(args.labels, ndmin=1),
+        RangeIndex.from_file(args.ranges).edges,
+        features=feature_names(args.features),
+        seed=args.seed,
+        score=args.score
+    )
+    print(f"Model saved to '{args.output}'")
+
+if __name__ == "__main__":
+    main()
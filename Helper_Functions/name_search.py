@@ -0,0 +1,156 @@
+"""
+Player Name Search
+
+Finds players without typing their name exactly as it appears in the database:
+    - a prefix trie over full names and over every word of a name, for autocomplete
+      ("ndi" or "evan nd" find "Evan Ndicka")
+    - a trigram index for typo-tolerant matching ("evan ndika" finds "Evan Ndicka")
+
+Only the names that share enough trigrams with the query are scored, and only the best
+of those are compared character by character, so a search does not touch every name.
+
+Authors: Logan Seitz, Marcos Wofford, Joseph Saunderson
+"""
+
+import heapq
+import math
+from collections import deque
+from difflib import SequenceMatcher
+
+import numpy as np
+
+# Key of the trie node entry holding the names that end at that node
+END = ''
+
+def name_trigrams(name):
+    """Returns the set of three-character pieces of a name, padded so word starts count."""
+    padded = f"  {name} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+class NameTrie:
+    """Prefix tree mapping name keys to name ids."""
+
+    def __init__(self):
+        self.root = {}
+
+    def insert(self, key, name_id):
+        node = self.root
+        for char in key:
+            node = node.setdefault(char, {})
+        node.setdefault(END, []).append(name_id)
+
+    def starting_with(self, prefix, limit):
+        """Returns up to limit name ids whose key starts with prefix, shortest keys first."""
+        node = self.root
+        for char in prefix:
+            node = node.get(char)
+            if node is None:
+                return []
+
+        found, seen = [], set()
+        queue = deque([node])
+        while queue and len(found) < limit:
+            node = queue.popleft()
+            for name_id in node.get(END, []):
+                if name_id not in seen:
+                    seen.add(name_id)
+                    found.append(name_id)
+            queue.extend(child for char, child in sorted(node.items()) if char != END)
+        return found[:limit]
+
+class NameSearch:
+    """
+    Prefix and typo-tolerant search over a list of normalized player names.
+    Results are the positions of the matching names in that list.
+    """
+
+    def __init__(self, names):
+        """Builds the trie and trigram index for the given normalized names."""
+        self.names = list(names)
+        self.trie = NameTrie()
+
+        postings = {}
+        sizes = np.empty(len(self.names), dtype=np.int32)
+        for name_id, name in enumerate(self.names):
+            # Full name and the rest of the name from every word on, so any word can be typed first
+            words = name.split(' ')
+            for start in range(len(words)):
+                self.trie.insert(' '.join(words[start:]), name_id)
+
+            grams = name_trigrams(name)
+            sizes[name_id] = len(grams)
+            for gram in grams:
+                postings.setdefault(gram, []).append(name_id)
+
+        self.sizes = sizes
+        self.min_size = int(sizes.min()) if len(sizes) else 0
+        self.postings = {gram: np.array(ids, dtype=np.int32) for gram, ids in postings.items()}
+
+    def prefix(self, query, limit=10):
+        """Returns ids of names with a word sequence starting with the normalized query."""
+        return self.trie.starting_with(query, limit)
+
+    def fuzzy(self, query, limit=10, min_score=0.3):
+        """
+        Returns ids of the names most similar to the normalized query, best first.
+
+        Candidates are ranked by the share of trigrams they have in common with the
+        query, and the best few are re-ranked by character similarity.
+        """
+        grams = name_trigrams(query)
+        lists = sorted((self.postings[gram] for gram in grams if gram in self.postings), key=len)
+
+        # A name scoring min_score shares at least `needed` trigrams with the query, so it is in
+        # one of the lists left after dropping the needed - 1 longest (most common) ones
+        needed = max(1, math.ceil(min_score * (len(grams) + self.min_size) / 2))
+        if len(lists) < needed or limit < 1:
+            return []
+        rare, common = lists[:len(lists) - needed + 1], lists[len(lists) - needed + 1:]
+
+        # Shared trigrams of every candidate; the common lists are only looked up for the candidates
+        # that could still reach min_score if they were in all of them
+        candidates, shared = np.unique(np.concatenate(rare), return_counts=True)
+        reachable = 2.0 * (shared + len(common)) >= min_score * (len(grams) + self.sizes[candidates])
+        candidates, shared = candidates[reachable], shared[reachable]
+        for ids in common:
+            found = np.minimum(np.searchsorted(ids, candidates), len(ids) - 1)
+            shared += ids[found] == candidates
+
+        # Dice score of every candidate
+        scores = 2.0 * shared / (len(grams) + self.sizes[candidates])
+        keep = scores >= min_score
+        candidates, scores = candidates[keep], scores[keep]
+
+        # Only the best few candidates get the slower character comparison
+        shortlist = min(len(candidates), max(3 * limit, 20))
+        if shortlist < len(candidates):
+            best = np.argpartition(-scores, shortlist - 1)[:shortlist]
+            candidates, scores = candidates[best], scores[best]
+
+        # Best trigram scores first; a name whose cheap upper bounds of the character similarity
+        # cannot beat the limit-th best name so far is not compared character by character
+        matcher = SequenceMatcher(None, b=query)
+        ranked = []  # heap of (similarity + score, -name id), the worst kept name on top
+        for name_id, score in sorted(zip(candidates.tolist(), scores.tolist()), key=lambda item: -item[1]):
+            matcher.set_seq1(self.names[name_id])
+            if len(ranked) == limit and (score + matcher.real_quick_ratio(), -name_id) < ranked[0]:
+                continue
+            if len(ranked) == limit and (score + matcher.quick_ratio(), -name_id) < ranked[0]:
+                continue
+            item = (matcher.ratio() + score, -name_id)
+            if len(ranked) < limit:
+                heapq.heappush(ranked, item)
+            else:
+                heapq.heappushpop(ranked, item)
+        return [-name_id for _, name_id in sorted(ranked, reverse=True)]
+
+    def search(self, query, limit=10):
+        """Returns ids of matching names: exact match first, then prefix matches, then fuzzy matches."""
+        found = []
+        for name_id in self.prefix(query, limit) + self.fuzzy(query, limit):
+            if name_id not in found:
+                found.append(name_id)
+
+        # An exact match always comes first
+        found.sort(key=lambda name_id: self.names[name_id] != query)
+        return found[:limit]
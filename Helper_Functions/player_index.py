@@ -0,0 +1,103 @@
+"""
+Player Index
+
+Hash index over the player database CSV, keyed on a normalized player name so that
+"evan  ndicka" or "Évan Ndicka" find "Evan Ndicka", plus a name search (name_search.py)
+suggesting players for partial or misspelled names. The index is built once and saved
+next to the CSV; it is rebuilt automatically when the CSV changes. The database can
+also be a Parquet or Arrow file (table_store.py).
+
+Authors: Logan Seitz, Marcos Wofford, Joseph Saunderson
+"""
+
+import csv
+import os
+import pickle
+import unicodedata
+
+from name_search import NameSearch
+from table_store import read_table, table_format
+
+# Bumped whenever the layout of the saved index changes
+INDEX_VERSION = 3
+
+def normalize_name(name):
+    """Folds case, accents and whitespace of a player name."""
+    decomposed = unicodedata.normalize('NFKD', name)
+    without_accents = ''.join(c for c in decomposed if not unicodedata.combining(c))
+    return ' '.join(without_accents.casefold().split())
+
+class PlayerIndex:
+    """Player rows of a database CSV grouped by normalized name."""
+
+    def __init__(self, rows):
+        """Builds the index from an iterable of player row dictionaries."""
+        self.rows = []
+        self.by_name = {}
+        for row in rows:
+            self.by_name.setdefault(normalize_name(row['name']), []).append(len(self.rows))
+            self.rows.append(row)
+
+        # Prefix and typo-tolerant search over the distinct normalized names
+        self.name_keys = list(self.by_name)
+        self.name_search = NameSearch(self.name_keys)
+
+    @classmethod
+    def from_csv(cls, database_file):
+        """Reads every row of the database CSV into a new index."""
+        with open(database_file, 'r', encoding='utf-8') as f:
+            return cls(csv.DictReader(f))
+
+    @classmethod
+    def from_file(cls, database_file):
+        """Reads a CSV, Parquet or Arrow database, every value as text like the CSV reader gives."""
+        if table_format(database_file) == 'csv':
+            return cls.from_csv(database_file)
+        return cls(read_table(database_file).astype('string').fillna('').to_dict('records'))
+
+    def lookup(self, player_name):
+        """Returns every row whose name matches player_name after normalization (empty list if none)."""
+        return [self.rows[i] for i in self.by_name.get(normalize_name(player_name), [])]
+
+    def suggest(self, player_name, limit=5):
+        """Returns up to limit player names matching a partial or misspelled name, best first."""
+        name_ids = self.name_search.search(normalize_name(player_name), limit)
+        return [self.rows[self.by_name[self.name_keys[i]][0]]['name'] for i in name_ids]
+
+    def __len__(self):
+        return len(self.rows)
+
+def default_cache_file(database_file):
+    """Cache file used for a database CSV when none is given."""
+    return database_file + '.index.pkl'
+
+def load_player_index(database_file, cache_file=None):
+    """
+    Returns the index of a database CSV, from the cache file when it was built from
+    the current version of the CSV, otherwise rebuilt from the CSV and saved.
+    """
+    cache_file = cache_file or default_cache_file(database_file)
+    stat = os.stat(database_file)
+    source = (stat.st_mtime_ns, stat.st_size)
+
+    try:
+        with open(cache_file, 'rb') as f:
+            cached = pickle.load(f)
+        if cached['version'] == INDEX_VERSION and cached['source'] == source:
+            return cached['index']
+    except (OSError, pickle.UnpicklingError, EOFError, KeyError, TypeError, AttributeError):
+        # Missing, unreadable or old cache, rebuild it below
+        pass
+
+    index = PlayerIndex.from_file(database_file)
+
+    # A cache that cannot be written only costs a rebuild next time
+    try:
+        tmp_file = cache_file + '.tmp'
+        with open(tmp_file, 'wb') as f:
+            pickle.dump({'version': INDEX_VERSION, 'source': source, 'index': index}, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp_file, cache_file)
+    except OSError:
+        pass
+
+    return index
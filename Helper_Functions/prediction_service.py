@@ -0,0 +1,201 @@
+"""
+Transfer Price Prediction Service
+
+Long-running version of Get_Searched_Prediction.py. The player database and the model
+file are loaded once, and every request is answered from memory, so a session of many
+lookups only pays the start-up and file parsing cost once.
+
+Two ways to run it:
+    python prediction_service.py --stdin
+        Reads one request per line from standard input and writes one JSON line per request.
+        A line is either a player name or a JSON list of names for a batch.
+
+    python prediction_service.py --port 8000
+        Local HTTP server answering JSON:
+            GET  /predict?name=Evan%20Ndicka
+            POST /predict   {"names": ["Evan Ndicka", "Leon Goretzka"]}
+            GET  /search?q=ndick   (names matching a partial or misspelled name)
+
+Authors: Logan Seitz, Marcos Wofford, Joseph Saunderson
+"""
+
+import argparse
+import json
+import sys
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+import numpy as np
+import pandas as pd
+
+from feature_registry import compute_features
+from model_artifact import load_model
+from player_index import load_player_index
+from range_index import RangeIndex
+
+class PredictionService:
+    """
+    Holds the player database and a model in memory and predicts price ranges for
+    one or many players at a time.
+    """
+
+    def __init__(self, database_file, model_file):
+        """Loads the player database and the model file once."""
+        self.model = load_model(model_file)
+        self.ranges = RangeIndex(self.model["range_edges"])
+        self.players = load_player_index(database_file)
+
+    def predict(self, names):
+        """
+        Predicts the price range of every player in names.
+
+        Returns:
+            list of dict: One result per name, in order. Players that are found and have
+            all features get "centroid_line", "label", "range_lower" and "range_upper"
+            (in millions of euros), the others an "error".
+        """
+        results = [{"name": name} for name in names]
+
+        # Gather the row of every player that is found
+        rows, player_rows = [], []
+        for i, name in enumerate(names):
+            # First matching row, the same as find_player_row
+            matches = self.players.lookup(name)
+            if not matches:
+                results[i]["error"] = "player not found"
+                results[i]["suggestions"] = self.players.suggest(name)
+                continue
+            rows.append(i)
+            player_rows.append(matches[0])
+
+        if not rows:
+            return results
+
+        # Features of every found player in one pass, those missing one cannot be predicted
+        features = compute_features(pd.DataFrame(player_rows), self.model["features"]).to_numpy()
+        complete = ~np.isnan(features).any(axis=1)
+        for i in np.asarray(rows)[~complete]:
+            results[i]["error"] = "insufficient data for prediction"
+        rows = [i for i, keep in zip(rows, complete) if keep]
+        if not rows:
+            return results
+
+        # Closest centroid of every player at once, in the feature scaling of the model
+        features = self.model["scaler"].transform(features[complete])
+        centroids = self.model["centroids"]
+        distances = np.linalg.norm(features[:, np.newaxis, :] - centroids[np.newaxis, :, :], axis=2)
+        centroid_index = np.argmin(distances, axis=1)
+
+        # Range each centroid label falls in
+        labels = self.model["cluster_labels"][centroid_index]
+        lowers, uppers = self.ranges.bounds(labels)
+
+        for i, index, label, lower, upper in zip(rows, centroid_index, labels, lowers, uppers):
+            if np.isnan(lower):
+                results[i]["error"] = "cluster label outside every price range"
+                continue
+            results[i].update({
+                "centroid_line": int(index) + 1,
+                "label": float(label),
+                "range_lower": round(float(lower) / 1e6, 3),
+                "range_upper": round(float(upper) / 1e6, 3),
+            })
+
+        return results
+
+    def predict_one(self, name):
+        """Predicts the price range of a single player."""
+        return self.predict([name])[0]
+
+    def search(self, query, limit=10):
+        """Returns player names matching a partial or misspelled name, best first."""
+        return self.players.suggest(query, limit)
+
+def serve_stdin(service, infile=sys.stdin, outfile=sys.stdout):
+    """Answers one request per input line until the input ends."""
+    for line in infile:
+        line = line.strip()
+        if not line:
+            continue
+
+        # A JSON list is a batch, anything else is a single name
+        if line.startswith('['):
+            try:
+                response = service.predict(json.loads(line))
+            except (ValueError, TypeError):
+                response = {"error": "invalid JSON list of names"}
+        else:
+            response = service.predict_one(line)
+
+        outfile.write(json.dumps(response) + "\n")
+        outfile.flush()
+
+def make_handler(service):
+    """Builds an HTTP request handler class answering from the given service."""
+
+    class PredictionHandler(BaseHTTPRequestHandler):
+
+        def send_json(self, status, body):
+            data = json.dumps(body).encode('utf-8')
+            self.send_response(status)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+        def do_GET(self):
+            url = urlparse(self.path)
+            query = parse_qs(url.query)
+            if url.path == '/search' and query.get('q'):
+                self.send_json(200, {"matches": service.search(query['q'][0])})
+                return
+            names = query.get('name')
+            if url.path != '/predict' or not names:
+                self.send_json(404, {"error": "use /predict?name=<player name>"})
+                return
+            self.send_json(200, service.predict(names) if len(names) > 1 else service.predict_one(names[0]))
+
+        def do_POST(self):
+            if urlparse(self.path).path != '/predict':
+                self.send_json(404, {"error": "use POST /predict"})
+                return
+            try:
+                length = int(self.headers.get('Content-Length', 0))
+                names = json.loads(self.rfile.read(length))["names"]
+                if not isinstance(names, list) or not all(isinstance(name, str) for name in names):
+                    raise TypeError
+            except (ValueError, KeyError, TypeError):
+                self.send_json(400, {"error": "expected {\"names\": [\"<player name>\", ...]}"})
+                return
+            self.send_json(200, {"predictions": service.predict(names)})
+
+    return PredictionHandler
+
+def main():
+    """Loads the database and model once and serves predictions."""
+    parser = argparse.ArgumentParser(description="Serve transfer price predictions from memory.")
+    parser.add_argument("--database", default="merged_players.csv", help="player database CSV")
+    parser.add_argument("--model", default="model_31_65.npz", help="model file from model_artifact.py")
+    mode = parser.add_mutually_exclusive_group(required=True)
+    mode.add_argument("--stdin", action="store_true", help="answer one request per line of standard input")
+    mode.add_argument("--port", type=int, help="serve HTTP/JSON on this port")
+    parser.add_argument("--host", default="127.0.0.1", help="address to listen on")
+    args = parser.parse_args()
+
+    service = PredictionService(args.database, args.model)
+
+    if args.stdin:
+        serve_stdin(service)
+        return
+
+    server = ThreadingHTTPServer((args.host, args.port), make_handler(service))
+    print(f"Serving predictions on http://{args.host}:{args.port}/predict")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,83 @@
+"""
+Market Value Parser
+
+Turns Transfermarkt market value strings into whole euros, for a whole column at once:
+    '€28.58m' -> 28580000      '€450k' -> 450000      '€1.20bn' -> 1200000000
+    '€1m'     -> 1000000       '€2.125m' -> 2125000   '1,50 Mio. €' -> 1500000
+    '500 Tsd. €' -> 500000     '3.098e+06' -> 3098000 (plain numbers are already euros)
+
+Whole and decimal digits are combined as integers, so no value picks up floating point
+error. Values that cannot be read ('-', '', None) become missing (<NA>). Values in another
+currency (£, $) are only converted when a rate to euros is given.
+
+Authors: Logan Seitz, Marcos Wofford, Joseph Saunderson
+"""
+
+import numpy as np
+import pandas as pd
+
+# Multiplier of every suffix Transfermarkt uses, English and German site
+SUFFIX_MULTIPLIERS = {
+    '': 1,
+    'k': 1_000, 'th': 1_000, 'tsd': 1_000,
+    'm': 1_000_000, 'mio': 1_000_000,
+    'bn': 1_000_000_000, 'mrd': 1_000_000_000,
+}
+
+# Euros per unit of each currency symbol, other currencies need an explicit rate
+EURO_RATES = {'€': 1.0}
+
+PRICE_PATTERN = (
+    r'^(?P<before>[€£$])?\s*'
+    r'(?P<whole>\d+)(?:[.,](?P<frac>\d+))?\s*'
+    r'(?P<suffix>bn|mrd|mio|tsd|th|m|k)?\.?\s*'
+    r'(?P<after>[€£$])?$'
+)
+
+def parse_market_values(values, rates=None):
+    """
+    Parses market values into euros.
+
+    Args:
+        values (list, np.ndarray or pd.Series): Market value strings or numbers.
+        rates (dict or None): Euros per unit of a currency symbol, added to EURO_RATES.
+
+    Returns:
+        pd.Series: Euros as nullable int64 (Int64), <NA> where a value could not be read.
+    """
+    values = pd.Series(values)
+    index = values.index
+    rates = {**EURO_RATES, **(rates or {})}
+
+    # Plain numbers, including the scientific notation np.savetxt writes, are already euros
+    text = values.astype('string').str.strip().str.lower()
+    numbers = pd.to_numeric(text, errors='coerce')
+
+    parts = text.str.extract(PRICE_PATTERN)
+    whole = pd.to_numeric(parts['whole'], errors='coerce').astype('Int64')
+    multiplier = parts['suffix'].fillna('').map(SUFFIX_MULTIPLIERS).astype('Int64')
+
+    # Decimals as an integer over a power of ten, rounded to the nearest euro
+    frac = parts['frac'].fillna('')
+    frac_digits = frac.str.len().astype('Int64')
+    frac_value = pd.to_numeric(frac.replace('', '0')).astype('Int64')
+    scale = pd.Series(np.power(10, frac_digits.fillna(0).astype(np.int64).to_numpy()), index=index, dtype='Int64')
+    euros = whole * multiplier + (frac_value * multiplier + scale // 2) // scale
+
+    # Convert other currencies, unknown ones become missing
+    currency = parts['before'].fillna(parts['after']).fillna('€')
+    rate = currency.map(rates)
+    foreign = currency != '€'
+    if foreign.any():
+        euros = euros.astype('Float64')
+        euros[foreign] = (euros[foreign] * rate[foreign].astype('Float64')).round()
+        euros = euros.astype('Int64')
+
+    # Numbers first, then the Transfermarkt formats
+    from_numbers = numbers.round().astype('Int64')
+    return from_numbers.fillna(euros).astype('Int64')
+
+def parse_market_value(value, rates=None):
+    """Parses a single market value into euros, None if it cannot be read."""
+    euros = parse_market_values([value], rates).iloc[0]
+    return None if pd.isna(euros) else int(euros)
@@ -0,0 +1,61 @@
+"""
+Price Range Index
+
+Sorted array of price range edges, as written to ranges.txt by final_prep.py, that finds
+the range of many prices or cluster labels at once with a binary search.
+
+A value belongs to the range with lower <= value < upper, except that the highest edge
+belongs to the last range. Values outside all ranges get range -1.
+
+Authors: Logan Seitz, Marcos Wofford, Joseph Saunderson
+"""
+
+import numpy as np
+
+def ranges_to_edges(ranges):
+    """Turns (lower, upper) range pairs, as saved in ranges.txt, into one sorted array of edges."""
+    ranges = np.asarray(ranges, dtype=float).reshape(-1, 2)
+    if not np.allclose(ranges[1:, 0], ranges[:-1, 1]):
+        raise ValueError("Price ranges are not contiguous")
+    return np.append(ranges[:, 0], ranges[-1, 1])
+
+class RangeIndex:
+    """Price ranges given by their sorted edges."""
+
+    def __init__(self, edges):
+        self.edges = np.asarray(edges, dtype=float).ravel()
+        if len(self.edges) < 2 or np.any(np.diff(self.edges) <= 0):
+            raise ValueError("Range edges must be at least two strictly increasing values")
+
+    @classmethod
+    def from_file(cls, ranges_file):
+        """Loads the (lower, upper) pairs of a ranges.txt file."""
+        return cls(ranges_to_edges(np.loadtxt(ranges_file, ndmin=2)))
+
+    @property
+    def ranges(self):
+        """(lower, upper) pair of every range, in the layout of ranges.txt."""
+        return np.column_stack((self.edges[:-1], self.edges[1:]))
+
+    def __len__(self):
+        return len(self.edges) - 1
+
+    def locate(self, values):
+        """Returns the range index of every value, -1 for values outside all ranges."""
+        values = np.asarray(values, dtype=float)
+        index = np.asarray(np.searchsorted(self.edges, values, side='right') - 1)
+
+        # The highest edge closes the last range
+        index[values == self.edges[-1]] = len(self) - 1
+        index[(values < self.edges[0]) | (values > self.edges[-1]) | np.isnan(values)] = -1
+        return index
+
+    def bounds(self, values):
+        """Returns the lower and upper edge of the range of every value, nan outside all ranges."""
+        index = self.locate(values)
+        inside = index >= 0
+        lower = np.full(index.shape, np.nan)
+        upper = np.full(index.shape, np.nan)
+        lower[inside] = self.edges[index[inside]]
+        upper[inside] = self.edges[index[inside] + 1]
+        return lower, upper
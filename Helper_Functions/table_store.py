@@ -0,0 +1,218 @@
+"""
+Table Store
+
+Reads and writes the tables handed from one pipeline stage to the next, in the format
+given by the file extension:
+
+    .csv                 comma separated text with a header (the default)
+    .txt                 whitespace separated numbers without a header, as read by np.loadtxt
+                         (columns are selected by their position 0, 1, 2, ...)
+    .parquet, .pq        Parquet, compressed columns with their dtypes
+    .arrow, .feather     Arrow IPC, memory mapped so reading does not copy the file
+
+Parquet and Arrow need the optional pyarrow package (pip install pyarrow). They keep
+the dtypes of every column, so a later stage does not parse text or guess types again,
+and reading a few columns (e.g. Age, time, xA, xG, Value) reads only those columns.
+
+Authors: Logan Seitz, Marcos Wofford, Joseph Saunderson
+"""
+
+import os
+from itertools import islice
+
+import numpy as np
+import pandas as pd
+
+# File extension -> storage format
+EXTENSIONS = {
+    '.csv': 'csv',
+    '.txt': 'text',
+    '.parquet': 'parquet',
+    '.pq': 'parquet',
+    '.arrow': 'arrow',
+    '.feather': 'arrow',
+}
+
+# Extension written for every storage format
+FORMAT_EXTENSIONS = {'csv': '.csv', 'text': '.txt', 'parquet': '.parquet', 'arrow': '.arrow'}
+
+# Rows read at a time by iter_tables and iter_matrix
+CHUNK_SIZE = 100_000
+
+def table_format(path):
+    """Returns the storage format of a file from its extension, csv for unknown extensions."""
+    return EXTENSIONS.get(os.path.splitext(path)[1].lower(), 'csv')
+
+def require_pyarrow(path):
+    """Imports pyarrow, with a readable error if it is not installed."""
+    try:
+        import pyarrow
+    except ImportError:
+        raise ImportError(f"Reading or writing '{path}' needs pyarrow, install it with 'pip install pyarrow'") from None
+    return pyarrow
+
+def read_arrow(path, columns=None):
+    """Reads an Arrow IPC file memory mapped, only the given columns."""
+    require_pyarrow(path)
+    from pyarrow import feather
+    return feather.read_table(path, columns=columns, memory_map=True)
+
+def read_table(path, columns=None, dtype=None):
+    """
+    Reads a table into a DataFrame.
+
+    Args:
+        path (str): File to read, the format is taken from the extension.
+        columns (list or None): Columns to read, None for all. Text files have no header,
+            their columns are the positions 0, 1, 2, ...
+        dtype (dict or None): Column -> dtype, applied after reading.
+    """
+    storage = table_format(path)
+    if storage == 'csv':
+        return pd.read_csv(path, usecols=columns, dtype=dtype)
+    if storage == 'text':
+        return text_columns(pd.DataFrame(np.loadtxt(path, ndmin=2)), columns, dtype)
+
+    if storage == 'parquet':
+        require_pyarrow(path)
+        data = pd.read_parquet(path, columns=columns)
+    else:
+        data = read_arrow(path, columns).to_pandas()
+    return data if dtype is None else data.astype(dtype)
+
+def text_columns(data, columns=None, dtype=None):
+    """Selects columns of a headerless text table by position and applies the dtypes, as read_table does."""
+    if columns is not None:
+        missing = [column for column in columns if column not in data.columns]
+        if missing:
+            raise KeyError(f"Text files have no header, columns are positions 0 to {data.shape[1] - 1}, not {missing}")
+        data = data[list(columns)]
+    return data if dtype is None else data.astype(dtype)
+
+def table_columns(path):
+    """Returns the column names of a table without reading its rows, None for headerless text files."""
+    storage = table_format(path)
+    if storage == 'csv':
+        return list(pd.read_csv(path, nrows=0).columns)
+    if storage == 'text':
+        return None
+    if storage == 'parquet':
+        require_pyarrow(path)
+        from pyarrow import parquet
+        return list(parquet.read_schema(path).names)
+    return list(read_arrow(path).schema.names)
+
+def iter_tables(path, columns=None, dtype=None, chunksize=CHUNK_SIZE):
+    """Reads a table chunksize rows at a time, yielding DataFrames."""
+    storage = table_format(path)
+    if storage == 'csv':
+        yield from pd.read_csv(path, usecols=columns, dtype=dtype, chunksize=chunksize)
+        return
+    if storage == 'text':
+        for batch in iter_matrix(path, chunksize):
+            yield text_columns(pd.DataFrame(batch), columns, dtype)
+        return
+
+    if storage == 'parquet':
+        require_pyarrow(path)
+        from pyarrow import parquet
+        batches = parquet.ParquetFile(path).iter_batches(batch_size=chunksize, columns=columns)
+    else:
+        batches = read_arrow(path, columns).to_batches(max_chunksize=chunksize)
+    for batch in batches:
+        data = batch.to_pandas()
+        yield data if dtype is None else data.astype(dtype)
+
+def write_table(data, path):
+    """Writes a DataFrame, the format is taken from the extension. The index is not written."""
+    storage = table_format(path)
+    if storage == 'csv':
+        data.to_csv(path, index=False)
+    elif storage == 'text':
+        data.to_csv(path, sep=' ', header=False, index=False, lineterminator='\n')
+    elif storage == 'parquet':
+        require_pyarrow(path)
+        data.to_parquet(path, index=False)
+    else:
+        require_pyarrow(path)
+        data.reset_index(drop=True).to_feather(path, compression='uncompressed')
+
+def write_tables(tables, path):
+    """
+    Writes DataFrames one after another into a single file, e.g. the chunks of iter_tables,
+    so the whole table is never held in memory. Every DataFrame needs the same columns;
+    Parquet and Arrow files take the dtypes of the first one.
+    """
+    storage = table_format(path)
+    if storage in ('csv', 'text'):
+        with open(path, 'w', newline='') as f:
+            for i, data in enumerate(tables):
+                if storage == 'csv':
+                    data.to_csv(f, header=i == 0, index=False)
+                else:
+                    data.to_csv(f, sep=' ', header=False, index=False, lineterminator='\n')
+        return
+
+    pyarrow = require_pyarrow(path)
+    writer = schema = None
+    try:
+        for data in tables:
+            batch = pyarrow.Table.from_pandas(data, schema=schema, preserve_index=False)
+            if writer is None:
+                schema = batch.schema
+                if storage == 'parquet':
+                    from pyarrow import parquet
+                    writer = parquet.ParquetWriter(path, schema)
+                else:
+                    # uncompressed, like write_table, so the file can be memory mapped
+                    writer = pyarrow.ipc.new_file(path, schema)
+            writer.write_table(batch)
+    finally:
+        if writer is not None:
+            writer.close()
+    if writer is None:
+        write_table(pd.DataFrame(), path)
+
+def infer_dtypes(data):
+    """
+    Returns the table with empty strings as missing values and every text column that
+    holds only numbers turned into a numeric column, so it can be stored with its dtype.
+    """
+    data = data.replace('', None)
+    for column in data.columns:
+        try:
+            numbers = pd.to_numeric(data[column], errors='coerce')
+        except TypeError:
+            # lists or other objects in the column
+            continue
+        if numbers.notna().sum() == data[column].notna().sum():
+            data[column] = numbers
+    return data
+
+def load_matrix(path, columns=None):
+    """Reads a numeric table as a 2D float array, e.g. the records of merged_players_final."""
+    if table_format(path) == 'text':
+        data = np.loadtxt(path, ndmin=2)
+        return data if columns is None else text_columns(pd.DataFrame(data), columns).to_numpy(dtype=float)
+    return read_table(path, columns).to_numpy(dtype=float)
+
+def iter_matrix(path, batch_size=CHUNK_SIZE):
+    """Reads a numeric table batch_size rows at a time, yielding 2D float arrays."""
+    if table_format(path) != 'text':
+        for data in iter_tables(path, chunksize=batch_size):
+            yield data.to_numpy(dtype=float)
+        return
+
+    with open(path, "r") as f:
+        while True:
+            lines = list(islice(f, batch_size))
+            if not lines:
+                return
+            yield np.loadtxt(lines, ndmin=2)
+
+def save_matrix(path, data, columns, fmt='%.18e'):
+    """Writes a 2D array, with fmt for text files and the given column names otherwise."""
+    if table_format(path) == 'text':
+        np.savetxt(path, data, fmt=fmt)
+    else:
+        write_table(pd.DataFrame(data, columns=columns), path)
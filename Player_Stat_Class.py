@@ -0,0 +1,206 @@
+# Player database held in memory as columns, for looking up players and predicting their price
+# A table (csv, parquet, arrow or json) is read once into one NumPy array per column:
+#   numeric columns as float64, the market value in euros, text columns as category codes plus
+#   one array of the distinct values, so repeated teams and positions are stored once
+# PlayerStats is a view of one row of the database, it copies nothing
+# predict_price finds the closest centroid of the trained model and returns its price range
+#
+# database = PlayerDatabase("Helper_Functions/merged_players.csv")
+# player = database.get_player("Evan Ndicka")
+# player.get_xG(), player.get_minutes(), player.predict_price()
+
+import json
+import os
+import sys
+
+import numpy as np
+import pandas as pd
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), 'Helper_Functions'))
+from feature_registry import compute_features, input_dtypes
+from model_artifact import load_model
+from player_index import normalize_name
+from price_parser import parse_market_values
+from range_index import RangeIndex
+from table_store import infer_dtypes, read_table
+
+# Model used by predict_price when none is given
+DEFAULT_MODEL = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'Helper_Functions', 'model_31_65.npz')
+
+# Column names of each stat in the scraped sources, the first one present is used
+STAT_COLUMNS = {
+    "xG": ("xG",),
+    "G": ("goals", "Gls", "G"),
+    "xA": ("xA",),
+    "A": ("assists", "Ast", "A"),
+    "minutes": ("time", "Min", "minutes"),
+    "SOT": ("SoT", "shots_on_target", "SOT"),
+    "shots": ("shots", "Sh"),
+    "age": ("Age", "age"),
+}
+
+
+#Class to interface with a single players data returned from PlayerDatabase
+
+class PlayerStats:
+    __slots__ = ("database", "row")
+
+    def __init__(self, database, row):
+        self.database = database
+        self.row = row
+
+    def __getitem__(self, column):
+        return self.database.value(column, self.row)
+
+    def get(self, stat, default=0):
+        # first column of the stat that the database has, default if missing
+        for column in STAT_COLUMNS.get(stat, (stat,)):
+            if column in self.database.columns:
+                value = self.database.value(column, self.row)
+                if value is not None and not (isinstance(value, float) and np.isnan(value)):
+                    return value
+        return default
+
+    @property
+    def name(self):
+        return self.database.value("name", self.row)
+
+    def get_xG(self):
+        return self.get("xG")
+
+    def get_G(self):
+        return self.get("G")
+
+    def get_xA(self):
+        return self.get("xA")
+
+    def get_A(self):
+        return self.get("A")
+
+    def get_minutes(self):
+        return self.get("minutes")
+
+    def get_SOT(self):
+        return self.get("SOT")
+
+    def get_shots(self):
+        return self.get("shots")
+
+    def get_age(self):
+        return self.get("age")
+
+    def get_value(self):
+        # market value in euros
+        return self.get("Value", None)
+
+    def predict_price(self, model=None):
+        # (lower, upper) euros of the predicted price range, None if a feature is missing
+        lower, upper = self.database.predict_prices([self.row], model)
+        if np.isnan(lower[0]):
+            return None
+        return float(lower[0]), float(upper[0])
+
+    def __repr__(self):
+        return f"PlayerStats({self.name!r})"
+
+
+#class to pull data into the program from file, and return PlayerStats object given a player name
+
+class PlayerDatabase:
+    def __init__(self, path, name_column=None, model=None):
+        self.model = model
+        self.columns = {}       # column -> float64 array, or category codes (int32) for text
+        self.categories = {}    # text column -> array of its distinct values
+
+        table = self.read(path)
+        name_column = name_column or next(c for c in ("name", "Name", "player_name") if c in table.columns)
+        table = table.rename(columns={name_column: "name"})
+
+        # market values as euros, whatever format they were scraped in
+        if "Value" in table.columns and table["Value"].dtype.kind not in "iuf":
+            table["Value"] = parse_market_values(table["Value"]).astype("Float64")
+
+        for column in table.columns:
+            values = table[column]
+            if values.dtype.kind in "iufb" or isinstance(values.dtype, (pd.Float64Dtype, pd.Int64Dtype)):
+                self.columns[column] = values.to_numpy(dtype=np.float64, na_value=np.nan)
+            else:
+                codes, uniques = pd.factorize(values.astype(object))
+                self.columns[column] = codes.astype(np.int32)
+                self.categories[column] = np.asarray(uniques, dtype=object)
+
+        # normalized name -> rows, case, accents and spacing folded like the predictor
+        self.by_name = {}
+        names = self.categories["name"]
+        keys = [normalize_name(str(name)) for name in names]
+        for row, code in enumerate(self.columns["name"]):
+            if code >= 0:
+                self.by_name.setdefault(keys[code], []).append(row)
+
+    @staticmethod
+    def read(path):
+        # json: {name: {stat: value}} or a list of rows, anything else through table_store
+        if os.path.splitext(path)[1].lower() == ".json":
+            with open(path) as f:
+                players = json.load(f)
+            if isinstance(players, dict):
+                players = [{"name": name, **stats} for name, stats in players.items()]
+            return infer_dtypes(pd.DataFrame(players))
+        return infer_dtypes(read_table(path))
+
+    def __len__(self):
+        return len(self.columns["name"])
+
+    def value(self, column, row):
+        # one value, a float for numeric columns, the text (or None) for text columns
+        if column not in self.columns:
+            raise KeyError(f"No column '{column}' in the player database")
+        value = self.columns[column][row]
+        if column in self.categories:
+            return self.categories[column][value] if value >= 0 else None
+        return float(value)
+
+    def get_players(self, name):
+        return [PlayerStats(self, row) for row in self.by_name.get(normalize_name(name), [])]
+
+    def get_player(self, name):
+        players = self.get_players(name)
+        if players:
+            return players[0]
+        raise ValueError(f"Player '{name}' not found.")
+
+    def load_default_model(self):
+        if self.model is None:
+            self.model = load_model(DEFAULT_MODEL)
+        return self.model
+
+    def column_values(self, column, rows):
+        # values of a column at the given rows, text columns decoded, None where missing
+        values = self.columns[column][rows]
+        if column not in self.categories:
+            return values
+        return np.where(values >= 0, self.categories[column][values], None)
+
+    def features(self, rows, names):
+        # rows x features matrix (feature_registry.py), nan where a feature is missing or not numeric
+        inputs = pd.DataFrame({column: self.column_values(column, rows)
+                               for column in input_dtypes(names) if column in self.columns},
+                              index=np.arange(len(rows)))
+        return compute_features(inputs, names).to_numpy()
+
+    def predict_prices(self, rows=None, model=None):
+        # (lower, upper) euros of the predicted range of every row, nan where a feature is missing
+        model = model or self.load_default_model()
+        rows = np.arange(len(self)) if rows is None else np.asarray(rows)
+        points = model["scaler"].transform(self.features(rows, model["features"]))
+        centroids = model["centroids"]
+
+        # squared distances to every centroid, |p|^2 - 2 p.c + |c|^2
+        distances = (points ** 2).sum(axis=1)[:, np.newaxis] - 2 * points @ centroids.T + (centroids ** 2).sum(axis=1)
+        labels = model["cluster_labels"][np.argmin(np.nan_to_num(distances, nan=np.inf), axis=1)]
+
+        lower, upper = RangeIndex(model["range_edges"]).bounds(labels)
+        missing = np.isnan(points).any(axis=1)
+        lower[missing] = np.nan
+        upper[missing] = np.nan
+        return lower, upper
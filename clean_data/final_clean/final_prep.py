@@ -1,33 +1,97 @@
 #Joseph Saunderson
 #This file creates price ranges and averages each one and assigns that as the class label for each record
+#
+#python final_prep.py                                  60 evenly spaced ranges, as before
+#python final_prep.py --bins 40 --strategy quantile    40 ranges holding about the same number of players
+#python final_prep.py --bins 40 --strategy log         40 ranges evenly spaced on a log scale
+#python final_prep.py --strategy fixed --breakpoints 1000000 5000000 10000000 25000000 50000000
+#python final_prep.py --input merged_players.parquet --output merged_players_final.parquet   columnar files (needs pyarrow)
+#python final_prep.py --features extended   records of the extended feature set from data_sort.py, per-90 rates kept as decimals
+
+import argparse
+import os
+import sys
 
 import numpy as np
 
+#price ranges are shared with reassign_labels.py and the predictor in Helper_Functions
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..', 'Helper_Functions'))
+from feature_registry import FEATURE_SETS, feature_names
+from range_index import RangeIndex
+from table_store import load_matrix, save_matrix, table_columns
+
+def linear_edges(prices, bins, breakpoints=None):
+    #evenly spaced between the lowest and highest price
+    return np.linspace(np.min(prices), np.max(prices), bins + 1)
+
+def quantile_edges(prices, bins, breakpoints=None):
+    #about the same number of prices in every range, repeated prices can merge ranges
+    return np.unique(np.quantile(prices, np.linspace(0, 1, bins + 1)))
+
+def log_edges(prices, bins, breakpoints=None):
+    #evenly spaced on a log scale, suits the heavily skewed transfer values
+    if np.min(prices) <= 0:
+        raise ValueError("log ranges need all prices above 0")
+    return np.geomspace(np.min(prices), np.max(prices), bins + 1)
+
+def fixed_edges(prices, bins=None, breakpoints=None):
+    #given euro breakpoints, widened to cover the lowest and highest price
+    if not breakpoints:
+        raise ValueError("fixed ranges need --breakpoints")
+    return np.unique(np.concatenate((breakpoints, [np.min(prices), np.max(prices)])))
+
+BINNING_STRATEGIES = {
+    'linear': linear_edges,
+    'quantile': quantile_edges,
+    'log': log_edges,
+    'fixed': fixed_edges,
+}
+
+def main():
+    parser = argparse.ArgumentParser(description="Convert prices into price range labels.")
+    parser.add_argument("--input", default="merged_players.txt", help="records with the price in the last column")
+    parser.add_argument("--output", default="merged_players_final.txt", help="records with the range label")
+    parser.add_argument("--ranges", default="ranges.txt", help="output file of the ranges")
+    parser.add_argument("--bins", type=int, default=60, help="number of ranges")
+    parser.add_argument("--strategy", choices=BINNING_STRATEGIES, default="linear", help="how the ranges are spaced")
+    parser.add_argument("--breakpoints", type=float, nargs="+", default=None, help="euro breakpoints for --strategy fixed")
+    parser.add_argument("--features", choices=FEATURE_SETS, default="default", help="feature set of the records (feature_registry.py)")
+    parser.add_argument("--keep-decimals", action="store_true", help="keep the features as decimals instead of whole numbers (always done for other feature sets than default)")
+    args = parser.parse_args()
+
+    data = load_matrix(args.input)
+
+    #a columnar input names its columns, text records are named after the feature set
+    columns = table_columns(args.input) or feature_names(args.features) + ['Value']
+    if len(columns) != data.shape[1]:
+        parser.error(f"{args.input} has {data.shape[1]} columns, the '{args.features}' feature set and the price are {len(columns)}")
+
+    prices = data[:,-1]
+    print(f'mean: {np.mean(prices)}')
+    print(f'median: {np.median(prices)}')
+    print(f'min: {np.min(prices)}')
+    print(f'max: {np.max(prices)}')
+    print()
+
+    # Generate the range edges
+    range_index = RangeIndex(BINNING_STRATEGIES[args.strategy](prices, args.bins, args.breakpoints))
+
+    # Create the ranges
+    ranges = range_index.ranges
+
+    print(ranges)
+
+    # Replace every price with the midpoint of its range, lower <= p < upper and the highest price in the last range
+    midpoints = ((ranges[:, 0] + ranges[:, 1]) / 2).astype(int)
+    data[:,-1] = midpoints[range_index.locate(prices)]
+
+    #only the default features were ever written as whole numbers, ratios like xG per 90 would all round to 0 or 1
+    if args.keep_decimals or columns[:-1] != feature_names('default'):
+        save_matrix(args.output, data, columns, fmt=['%.10g'] * (data.shape[1] - 1) + ['%d'])
+    else:
+        #whole numbers, as the text output of the default features always had
+        save_matrix(args.output, data.astype(np.int64), columns, fmt='%d')
+    np.savetxt(args.ranges, ranges)
 
-data = np.loadtxt("merged_players.txt")
-
-prices = data[:,-1]
-print(f'mean: {np.mean(prices)}')
-print(f'median: {np.median(prices)}')
-print(f'min: {np.min(prices)}')
-print(f'max: {np.max(prices)}')
-print()
-# Generate evenly spaced points
-points = np.linspace(np.min(prices), np.max(prices), 60 + 1)
-
-# Create the ranges
-ranges = []
-#changed to range 60
-for i in range(60):
-    ranges.append((points[i], points[i+1]))
-
-print(ranges)
-
-for i in range(len(prices)):
-    for lower, upper in ranges:
-        if lower <= prices[i] < upper: # Check if the value falls within the current range
-            data[i,-1] = int((lower + upper) / 2)
-            
-np.savetxt('merged_players_final.txt', data, fmt='%d')
-ranges_numpy = np.array(ranges)
-np.savetxt('ranges.txt', ranges_numpy)
+if __name__ == "__main__":
+    main()
@@ -1,5 +1,7 @@
 #!/bin/bash
 #This is for finding average of the correct validations
+#Optionally pass ranges.txt as the second argument to bundle the best run into model_<iteration>_<k>.npz:
+#./after_kmeans.sh 50 ranges.txt
 #rm -r answers_$1
 #rm -r centroid_$1
 #rm -r clusters_$1
@@ -13,4 +15,10 @@ cp avg.py answers_$1/
 cd answers_$1
 python avg.py $1 > average_answer.txt
 python avg.py $1
-#rm answer_$1_*
\ No newline at end of file
+#rm answer_$1_*
+if [ -n "$2" ]; then
+    best=$(tail -n 1 average_answer.txt)
+    score=$(sed -n 2p average_answer.txt)
+    cd ..
+    python ../Helper_Functions/model_artifact.py centroid_$1/centroids${best}_$1.txt clusters_$1/cluster_labels_${best}_$1.txt $2 model_${best}_$1.npz --score ${score}
+fi
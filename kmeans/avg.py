@@ -15,4 +15,6 @@ all_data_np = np.array(all_data)
 avg = np.mean(all_data_np)
 print(avg)
 print(np.max(all_data_np))
+#iteration of the best run
+print(np.argmax(all_data_np))
     
@@ -7,124 +7,385 @@
 #for ((x=0;x<100;x++)); do echo "cat merged_players_final.txt | ./split.bash 40 python3 kmeans.py 50 ${x} > answer_50_clusters_${x}.txt"; done | ./parallelize.bash
 #./after_kmeans.sh 50
 
+#The same 100 runs can be done in a single process, which loads the data once and stores every run in
+#kmeans_sweeps.sqlite (sweep_store.py), then prints the mean and best score and exports the best model:
+#python3 kmeans.py sweep merged_players_final.txt 50 --validation 40 --runs 100 --seed 0 --ranges ranges.txt
+#--files also writes the answer, centroid and cluster label files for after_kmeans.sh
+#search.py tries many k and validation sizes this way in one command
+
+import argparse
+import os
 import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import shared_memory
+
 import numpy as np
 
-def euclidean_distance(point1, point2):
+#the model artifact and price ranges are shared with the predictor in Helper_Functions
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "Helper_Functions"))
+from feature_registry import FEATURE_SETS, feature_names
+from feature_scaling import SCALING_METHODS, FeatureScaler
+from range_index import RangeIndex
+from sweep_store import DEFAULT_STORE, SweepStore
+from table_store import load_matrix
+
+#seeding methods accepted by initial_centroids
+INIT_METHODS = ("first", "random", "kmeans++")
+
+#assignment methods accepted by train, hamerly skips distances that cannot change an assignment
+ALGORITHMS = ("lloyd", "hamerly")
+
+#default iteration cap for a single kmeans run
+MAX_ITER = 300
+
+#number of points whose distances are computed at once, bounds memory to chunk_size * k floats
+CHUNK_SIZE = 8192
+
+def squared_distances(points, centroids):
 
-    distance = 0
-    for p1, p2 in zip(point1, point2):
-        distance += (p1 - p2) ** 2
-    return distance ** 0.5
+    #||p - c||^2 = ||p||^2 - 2 p.c + ||c||^2 for every point/centroid pair at once
+    point_norms = np.einsum('ij,ij->i', points, points)[:, np.newaxis]
+    centroid_norms = np.einsum('ij,ij->i', centroids, centroids)[np.newaxis, :]
+    distances = point_norms - 2.0 * (points @ centroids.T) + centroid_norms
+
+    #rounding can leave tiny negatives where a point sits on a centroid
+    np.maximum(distances, 0.0, out=distances)
+    return distances
+
+def nearest_centroids(points, centroids, chunk_size=CHUNK_SIZE):
+
+    points = np.asarray(points, dtype=float)
+    centroids = np.asarray(centroids, dtype=float)
+
+    nearest = np.empty(len(points), dtype=np.intp)
+
+    #work through the points in chunks so the distance matrix never holds more than chunk_size rows
+    for start in range(0, len(points), chunk_size):
+        stop = start + chunk_size
+        distances = squared_distances(points[start:stop], centroids)
+        nearest[start:stop] = np.argmin(distances, axis=1)
+
+    return nearest
 
 def assign_clusters(data, centroids):
 
-    clusters = [[] for _ in range(len(centroids))]
-    
-    for i in range(len(data)):
-        example = data[i]
-        
-        #calculate distances to each centroid
-        distances = [euclidean_distance(example[:-1], centroid) for centroid in centroids]
-        
-        #find closest centroid
-        cluster_index = np.argmin(distances)
-        
-        #assign example to closest cluster
-        clusters[cluster_index].append(i)
-    
-    return clusters
+    #index of the closest centroid for every example (labels column excluded)
+    return nearest_centroids(data[:, :-1], centroids)
 
-def calculate_new_centroids(data, clusters, k):
+def nearest_two(points, centroids, chunk_size=CHUNK_SIZE):
 
-    #initialize centroids as zeros using k clusters and data's dimentions minus the labels
-    new_centroids = np.zeros((k, data.shape[1] - 1))
+    nearest = np.empty(len(points), dtype=np.intp)
+    first = np.empty(len(points))
+    second = np.full(len(points), np.inf)
 
-    for i in range(k):
-        cluster = clusters[i]
-        
-        #if cluster is empty, ignore it to prevent errors
-        if len(cluster) > 0:
-            #calc mean of each cluster
-            new_centroids[i] = np.mean(data[cluster, :-1], axis=0)
+    for start in range(0, len(points), chunk_size):
+        stop = start + chunk_size
 
-    return new_centroids
+        #exact distances, the bounds below must not be thrown off by rounding
+        distances = np.linalg.norm(points[start:stop, np.newaxis, :] - centroids[np.newaxis, :, :], axis=2)
+        nearest[start:stop] = np.argmin(distances, axis=1)
+        first[start:stop] = distances[np.arange(len(distances)), nearest[start:stop]]
+        if len(centroids) > 1:
+            second[start:stop] = np.partition(distances, 1, axis=1)[:, 1]
 
-def assign_labels(data, clusters):
+    return nearest, first, second
 
-    cluster_labels = []
+def hamerly_assign(data, centroids, state):
+    """
+    Assigns every example to its closest centroid, skipping distance computations
+    that cannot change the assignment (Hamerly's algorithm).
 
+    Each point keeps an upper bound on the distance to its own centroid and a lower
+    bound on the distance to any other centroid. A point whose upper bound is below
+    both its lower bound and half the distance from its centroid to the next closest
+    centroid cannot change cluster and is skipped.
 
-    for cluster in clusters:
-        if cluster:  #make sure cluster not empty to avoid errors
-            labels = data[cluster, -1]  #get labels for points in cluster
-            label_counts = {}
+    Args:
+        data (np.ndarray): Examples, label in the last column.
+        centroids (np.ndarray): Current centroids.
+        state (dict): Bounds kept between the iterations of one run, start with {}.
 
-            #count each label in the cluster
-            for label in labels:
-                if label in label_counts:
-                    label_counts[label] += 1
-                else:
-                    label_counts[label] = 1
+    Returns:
+        tuple: (clusters, skipped) where skipped is the number of point/centroid
+        distances that did not have to be computed.
+    """
+    features = data[:, :-1]
+    n, k = len(features), len(centroids)
 
-            #find most common label
-            majority_label = None
-            max_count = -1
-            for label, count in label_counts.items():
-                if count > max_count or (count == max_count and label < majority_label):
-                    majority_label = label
-                    max_count = count
+    if not state:
+        #first iteration computes everything
+        clusters, upper, lower = nearest_two(features, centroids)
+        state.update(clusters=clusters, upper=upper, lower=lower, centroids=centroids.copy())
+        return clusters.copy(), 0
 
-            cluster_labels.append(majority_label)
-        else:
-            cluster_labels.append(-1)  #empty cluster
+    clusters, upper, lower = state["clusters"], state["upper"], state["lower"]
+
+    #loosen the bounds by how far the centroids moved since the last assignment
+    moved = np.linalg.norm(centroids - state["centroids"], axis=1)
+    upper += moved[clusters]
+    if k > 1:
+        second_largest, largest = np.argsort(moved)[-2:]
+        lower -= np.where(clusters == largest, moved[second_largest], moved[largest])
+
+    #half the distance from each centroid to its closest other centroid
+    between = np.linalg.norm(centroids[:, np.newaxis, :] - centroids[np.newaxis, :, :], axis=2)
+    np.fill_diagonal(between, np.inf)
+    bound = np.maximum(0.5 * np.min(between, axis=1)[clusters], lower)
+
+    #tighten the upper bound of the points that fail the test and test again
+    check = np.flatnonzero(upper > bound)
+    upper[check] = np.linalg.norm(features[check] - centroids[clusters[check]], axis=1)
+    recompute = check[upper[check] > bound[check]]
+
+    #only these points need the distance to every centroid
+    if len(recompute):
+        clusters[recompute], upper[recompute], lower[recompute] = nearest_two(features[recompute], centroids)
+
+    state["centroids"] = centroids.copy()
+
+    skipped = n * k - len(check) - len(recompute) * k
+    return clusters.copy(), skipped
+
+def calculate_new_centroids(data, clusters, k):
+
+    features = data[:, :-1]
+
+    #sum the examples of each cluster and count them
+    sums = np.zeros((k, features.shape[1]))
+    np.add.at(sums, clusters, features)
+    counts = np.bincount(clusters, minlength=k)
+
+    #if cluster is empty, leave its centroid at zero to prevent errors
+    new_centroids = np.zeros((k, features.shape[1]))
+    non_empty = counts > 0
+    new_centroids[non_empty] = sums[non_empty] / counts[non_empty, np.newaxis]
+
+    return new_centroids
+
+def assign_labels(data, clusters, k):
+
+    #map each label to its position among the sorted distinct labels
+    distinct_labels, label_index = np.unique(data[:, -1], return_inverse=True)
+
+    #count every (cluster, label) pair
+    counts = np.bincount(clusters * len(distinct_labels) + label_index,
+                         minlength=k * len(distinct_labels)).reshape(k, len(distinct_labels))
+
+    #argmax returns the first maximum, so ties go to the smallest label
+    cluster_labels = distinct_labels[np.argmax(counts, axis=1)]
+
+    #empty cluster
+    cluster_labels[counts.sum(axis=1) == 0] = -1
 
     return cluster_labels
 
 def classify(validation_data, centroids, cluster_labels):
 
-    correct_count = 0
-    for example in validation_data: 
-        #calc distances from each centroid
-        distances = [euclidean_distance(example[:-1], centroid) for centroid in centroids]
-        #find closest centroid
-        cluster_index = np.argmin(distances)
-        predicted_label = cluster_labels[cluster_index]
-        #check if predicted label is right
-        if predicted_label == example[-1]:
-            correct_count += 1
-    return correct_count
-
-def kmeans(k, training_data, validation_data):
-
-    #assign centroids as first k data points
-    centroids = training_data[:k, :-1]
-
-    #assign points to clusters
-    clusters = assign_clusters(training_data, centroids)
-    
-    #calculate new positions of clusters
-    new_centroids = calculate_new_centroids(training_data, clusters, k)
-    
-    while (new_centroids != centroids).all():
-        centroids = new_centroids
-        
+    #find closest centroid for every validation example
+    cluster_index = nearest_centroids(validation_data[:, :-1], centroids)
+    predicted_labels = np.asarray(cluster_labels)[cluster_index]
+
+    #count the predicted labels that are right
+    return int(np.count_nonzero(predicted_labels == validation_data[:, -1]))
+
+def initial_centroids(training_data, k, init="first", rng=None):
+
+    features = training_data[:, :-1]
+    rng = np.random.default_rng(rng)
+
+    if init == "first":
+        #first k data points, depends on the row order of the file
+        return features[:k].copy()
+
+    if init == "random":
+        #k distinct data points picked uniformly
+        return features[rng.choice(len(features), size=k, replace=False)].copy()
+
+    if init == "kmeans++":
+        #first centroid uniformly, then each next one with probability proportional to squared distance
+        centroids = np.empty((k, features.shape[1]))
+        centroids[0] = features[rng.integers(len(features))]
+        closest = squared_distances(features, centroids[:1])[:, 0]
+
+        for i in range(1, k):
+            total = closest.sum()
+            if total > 0:
+                index = rng.choice(len(features), p=closest / total)
+            else:
+                #every point already sits on a centroid
+                index = rng.integers(len(features))
+            centroids[i] = features[index]
+            np.minimum(closest, squared_distances(features, centroids[i:i + 1])[:, 0], out=closest)
+
+        return centroids
+
+    raise ValueError(f"Unknown init '{init}', expected one of: {', '.join(INIT_METHODS)}")
+
+def train(k, training_data, init="first", max_iter=MAX_ITER, tol=0.0, rng=None, algorithm="lloyd", callback=None):
+
+    if algorithm not in ALGORITHMS:
+        raise ValueError(f"Unknown algorithm '{algorithm}', expected one of: {', '.join(ALGORITHMS)}")
+
+    centroids = initial_centroids(training_data, k, init, rng)
+
+    #bounds kept by hamerly_assign and the distance computations it skipped in each iteration
+    state = {}
+    skipped = []
+
+    iterations = 0
+    while True:
         #assign points to clusters
-        clusters = assign_clusters(training_data, centroids)
-        
+        if algorithm == "hamerly":
+            clusters, skipped_distances = hamerly_assign(training_data, centroids, state)
+        else:
+            clusters, skipped_distances = assign_clusters(training_data, centroids), 0
+        skipped.append(skipped_distances)
+
         #calculate new positions of clusters
         new_centroids = calculate_new_centroids(training_data, clusters, k)
+        iterations += 1
+
+        #callback(centroids, clusters, iterations) returning True stops the run early
+        if callback is not None and callback(new_centroids, clusters, iterations):
+            centroids = new_centroids
+            break
+
+        #converged once no centroid moves further than tol
+        shift = np.sqrt(np.max(np.sum((new_centroids - centroids) ** 2, axis=1)))
+        if shift <= tol or (max_iter is not None and iterations >= max_iter):
+            break
+
+        centroids = new_centroids
+
+    return centroids, clusters, iterations, skipped
+
+def kmeans_run(k, training_data, validation_data, init="first", max_iter=MAX_ITER, tol=0.0, rng=None,
+               algorithm="lloyd", min_count=None, check_every=2):
+    """
+    Trains kmeans on the training data and classifies the validation data.
+
+    Args:
+        k (int): Number of clusters.
+        training_data (np.ndarray): Training records, label in the last column.
+        validation_data (np.ndarray): Validation records, label in the last column.
+        init (str): Seeding method, one of "first", "random" or "kmeans++".
+        max_iter (int or None): Iteration cap, None runs until convergence.
+        tol (float): Largest centroid shift that still counts as converged.
+        rng (int, np.random.Generator or None): Randomness for the "random" and "kmeans++" seeding.
+        algorithm (str): "lloyd" computes every distance, "hamerly" skips the ones that cannot
+            change an assignment and gives the same clusters.
+        min_count (int or None): Every check_every iterations the validation data is classified with
+            the current centroids, and the run is stopped ("pruned") if fewer than min_count records
+            are correct. None never stops a run early.
+        check_every (int): Iterations between the checks of min_count.
+
+    Returns:
+        dict: "count" of correctly classified validation records, "cluster_labels",
+        "centroids", the number of "iterations" it took, the "skipped_distances"
+        (distance computations avoided) in each iteration, the wall-clock "seconds" and
+        whether the run was "pruned" by min_count.
+    """
+    start = time.perf_counter()
+
+    pruned = []
+    def check(centroids, clusters, iterations):
+        #partial validation score of the centroids so far, clearly worse runs are not finished
+        if min_count is None or iterations % check_every:
+            return False
+        if classify(validation_data, centroids, assign_labels(training_data, clusters, k)) < min_count:
+            pruned.append(iterations)
+        return bool(pruned)
+
+    centroids, clusters, iterations, skipped = train(k, training_data, init, max_iter, tol, rng, algorithm, check)
 
     #assign class labels to clusters
-    cluster_labels = assign_labels(training_data, clusters)
-    
-    #Write cluster labels and centroids to a file
-    
-    
+    cluster_labels = assign_labels(training_data, clusters, k)
+
     #classify validation samples
     count = classify(validation_data, centroids, cluster_labels)
 
-    return count, cluster_labels, centroids
+    return {"count": count, "cluster_labels": cluster_labels, "centroids": centroids, "iterations": iterations,
+            "skipped_distances": skipped, "seconds": time.perf_counter() - start, "pruned": bool(pruned)}
+
+def kmeans(k, training_data, validation_data, **options):
+
+    result = kmeans_run(k, training_data, validation_data, **options)
+    return result["count"], result["cluster_labels"], result["centroids"]
+
+def make_splits(n_rows, validation_size, runs, seed=None):
+
+    rng = np.random.default_rng(seed)
+
+    #same split as split.bash: shuffle the rows, the last validation_size are validation data
+    splits = []
+    for _ in range(runs):
+        order = rng.permutation(n_rows)
+        splits.append((order[:-validation_size], order[-validation_size:]))
+
+    return splits
+
+#dataset shared by every sweep worker, attached once per worker process
+_sweep_memory = None
+_sweep_data = None
+
+def _attach_sweep_data(name, shape, dtype):
+    global _sweep_memory, _sweep_data
+
+    _sweep_memory = shared_memory.SharedMemory(name=name)
+    _sweep_data = np.ndarray(shape, dtype=dtype, buffer=_sweep_memory.buf)
+
+def _run_split(k, train_index, validation_index, options):
+
+    #fancy indexing copies only this run's rows out of shared memory
+    return kmeans_run(k, _sweep_data[train_index], _sweep_data[validation_index], **options)
+
+def sweep(data, k, validation_size, runs=100, seed=None, workers=None, **options):
+    """
+    Runs kmeans on `runs` random training/validation splits of one dataset.
+
+    The dataset is placed in shared memory once and every run only receives the
+    row indices of its split, so no run re-reads or copies the whole file.
+
+    Args:
+        data (np.ndarray): All records, label in the last column.
+        k (int): Number of clusters.
+        validation_size (int): Number of records held out for validation in each run.
+        runs (int): Number of random restarts.
+        seed (int or None): Seed for the random splits.
+        workers (int or None): Number of worker processes, 1 runs everything in this process.
+        **options: Passed on to kmeans_run (init, max_iter, tol, algorithm).
+
+    Returns:
+        list of dict: One kmeans_run result per run, with its "run" number added.
+    """
+    data = np.ascontiguousarray(data, dtype=float)
+    splits = make_splits(len(data), validation_size, runs, seed)
+
+    #independent random streams for the seeding of every run
+    run_options = [dict(options, rng=run_seed) for run_seed in np.random.SeedSequence(seed).spawn(runs)]
+
+    if workers == 1:
+        outputs = [kmeans_run(k, data[train], data[validation], **opts)
+                   for (train, validation), opts in zip(splits, run_options)]
+    else:
+        memory = shared_memory.SharedMemory(create=True, size=data.nbytes)
+        try:
+            np.ndarray(data.shape, dtype=data.dtype, buffer=memory.buf)[:] = data
+
+            with ProcessPoolExecutor(max_workers=workers, initializer=_attach_sweep_data,
+                                     initargs=(memory.name, data.shape, data.dtype)) as pool:
+                futures = [pool.submit(_run_split, k, train, validation, opts)
+                           for (train, validation), opts in zip(splits, run_options)]
+                outputs = [future.result() for future in futures]
+        finally:
+            memory.close()
+            memory.unlink()
+
+    for run, result in enumerate(outputs):
+        result["run"] = run
+
+    return outputs
 
 #New Stuff
 def data_to_file(data, filename, delimiter=' '):
@@ -141,7 +402,93 @@ def data_to_file(data, filename, delimiter=' '):
     
     np.savetxt(filename, data, delimiter=delimiter)
     
+def sweep_main(argv):
+    parser = argparse.ArgumentParser(prog="kmeans.py sweep", description="Run many kmeans restarts in one process.")
+    parser.add_argument("data", help="records with the label in the last column (merged_players_final.txt or .parquet/.arrow)")
+    parser.add_argument("k", type=int, help="number of clusters")
+    parser.add_argument("--validation", type=int, default=40, help="validation records per run")
+    parser.add_argument("--runs", type=int, default=100, help="number of restarts")
+    parser.add_argument("--seed", type=int, default=None, help="seed for the random splits")
+    parser.add_argument("--workers", type=int, default=None, help="worker processes (default: all cores)")
+    parser.add_argument("--init", choices=INIT_METHODS, default="first", help="centroid seeding")
+    parser.add_argument("--max-iter", type=int, default=MAX_ITER, help="iteration cap per run")
+    parser.add_argument("--tol", type=float, default=0.0, help="centroid shift that counts as converged")
+    parser.add_argument("--algorithm", choices=ALGORITHMS, default="lloyd", help="cluster assignment method")
+    parser.add_argument("--features", choices=FEATURE_SETS, default="default", help="feature set of the records, stored in the model file")
+    parser.add_argument("--scaling", choices=SCALING_METHODS, default="none", help="feature scaling, fitted on all the records before the training/validation split")
+    parser.add_argument("--weights", type=float, nargs="+", default=None, help="weight of every feature after scaling")
+    parser.add_argument("--model", default=None, help="model file (.npz) for the best run, default model_<run>_<k>.npz, needs --ranges")
+    parser.add_argument("--ranges", default=None, help="ranges.txt from final_prep.py, stored with the sweep and the model file")
+    parser.add_argument("--store", default=DEFAULT_STORE, help="sweep store (sweep_store.py) every run is saved to")
+    parser.add_argument("--files", action="store_true", help="also write the answer, centroid and cluster label files of every run")
+    args = parser.parse_args(argv)
+
+    if args.model and not args.ranges:
+        parser.error("--model needs --ranges")
+    if args.files and (args.scaling != "none" or args.weights):
+        #the text predictor compares unscaled player stats with the centroids, only the model file keeps the scaling
+        parser.error("--files cannot be used with --scaling or --weights, predict a scaled run from its model file")
+
+    data = load_matrix(args.data)
+    features = feature_names(args.features)
+    if len(features) != data.shape[1] - 1:
+        if args.ranges:
+            parser.error(f"the '{args.features}' feature set has {len(features)} features, the records have {data.shape[1] - 1}")
+        #records of another feature set, stored without feature names
+        features = None
+    if args.weights and len(args.weights) != data.shape[1] - 1:
+        parser.error(f"--weights needs one weight per feature ({data.shape[1] - 1})")
+
+    #fit the scaling once on all the records, before they are split, and cluster the scaled
+    #features; every run's validation rows share the scaling statistics (no labels are used),
+    #so the sweep stores a single scaler. The label column stays as it is
+    scaler = FeatureScaler.fit(data[:, :-1], args.scaling, args.weights)
+    data = np.column_stack((scaler.transform(data[:, :-1]), data[:, -1]))
+
+    results = sweep(data, args.k, args.validation, args.runs, args.seed, args.workers,
+                    init=args.init, max_iter=args.max_iter, tol=args.tol, algorithm=args.algorithm)
+
+    #one row per run in the store instead of three small files per run
+    range_edges = RangeIndex.from_file(args.ranges).edges if args.ranges else None
+    options = {"init": args.init, "max_iter": args.max_iter, "tol": args.tol, "algorithm": args.algorithm,
+               "scaling": args.scaling, "weights": args.weights, "feature_set": args.features}
+    store = SweepStore(args.store)
+    sweep_id = store.add_sweep(results, args.data, args.k, args.validation, args.seed, options, features, scaler,
+                               range_edges)
+    summary = store.summary(sweep_id)
+    print("sweep", sweep_id, "saved to", args.store)
+
+    #the same output avg.py gave: mean score, best score and the best run
+    print(summary["mean_score"])
+    print(summary["best_score"])
+    print(summary["best_run"])
+    print("mean iterations:", np.mean([result["iterations"] for result in results]))
+
+    #share of the point/centroid distances that hamerly did not have to compute
+    total = sum(result["iterations"] for result in results) * (len(data) - args.validation) * args.k
+    print("skipped distance computations:", sum(sum(result["skipped_distances"]) for result in results) / total)
+
+    if args.files:
+        #the files the split.bash/parallelize.bash loop produces, for after_kmeans.sh
+        for result in results:
+            iteration, k = result["run"], args.k
+            data_to_file(result["cluster_labels"], "cluster_labels_" + str(iteration) + "_" + str(k) + ".txt")
+            data_to_file(result["centroids"], "centroids" + str(iteration) + "_" + str(k) + ".txt")
+            with open("answer_" + str(k) + "_clusters_" + str(iteration) + ".txt", "w") as f:
+                f.write(str(result["count"]) + "\n")
+
+    #export the best run, no picking it by hand
+    if args.ranges:
+        model = args.model or "model_" + str(summary["best_run"]) + "_" + str(args.k) + ".npz"
+        store.export_model(model, sweep_id, summary["best_run"])
+        print("best run", summary["best_run"], "saved to", model)
+    store.close()
+
 def main():
+    if len(sys.argv) > 1 and sys.argv[1] == "sweep":
+        sweep_main(sys.argv[2:])
+        return
+
     #command line args
     k = int(sys.argv[1])
     #training = sys.argv[2]
@@ -150,8 +497,8 @@ def main():
     training = sys.argv[3]
     validation = sys.argv[4]
     
-    training_data = np.loadtxt(training)
-    validation_data = np.loadtxt(validation)
+    training_data = load_matrix(training)
+    validation_data = load_matrix(validation)
 
     #K-means clustering and classification
     count, cluster_labels, centroids = kmeans(k, training_data, validation_data)
@@ -161,5 +508,6 @@ def main():
     #output correctly classified samples
     print(count)
 
-main()
+if __name__ == "__main__":
+    main()
 
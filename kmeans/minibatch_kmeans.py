@@ -0,0 +1,126 @@
+#Joseph Saunderson
+#Mini-batch kmeans for training files too large to hold in memory
+#Reads the training file a batch at a time and moves each centroid towards the mean of the
+#points assigned to it, with a learning rate of 1 / (points seen by that centroid so far).
+#Memory stays at about batch_size rows no matter how large the file is.
+#
+#python3 minibatch_kmeans.py merged_players_final.txt 65 --batch-size 1024 --epochs 3 --seed 0
+#writes centroids_minibatch_65.txt and cluster_labels_minibatch_65.txt, the same format kmeans.py writes
+#and Get_Searched_Prediction.py reads
+
+import argparse
+
+import numpy as np
+
+from kmeans import INIT_METHODS, data_to_file, initial_centroids, nearest_centroids
+from table_store import iter_matrix
+
+def read_batches(filename, batch_size):
+
+    #yield the records of the file batch_size rows at a time, text or a parquet/arrow file
+    yield from iter_matrix(filename, batch_size)
+
+def partial_fit(centroids, counts, batch):
+
+    features = batch[:, :-1]
+    clusters = nearest_centroids(features, centroids)
+
+    #points and their sum for every cluster in this batch
+    batch_counts = np.bincount(clusters, minlength=len(centroids))
+    batch_sums = np.zeros_like(centroids)
+    np.add.at(batch_sums, clusters, features)
+
+    #per centroid learning rate 1 / seen points, the same as updating one point at a time
+    updated = batch_counts > 0
+    counts += batch_counts
+    centroids[updated] += (batch_sums[updated] - batch_counts[updated, np.newaxis] * centroids[updated]) / counts[updated, np.newaxis]
+
+def label_counts(filename, centroids, batch_size):
+
+    #count every (cluster, label) pair in one more pass over the file
+    counts = {}
+    for batch in read_batches(filename, batch_size):
+        clusters = nearest_centroids(batch[:, :-1], centroids)
+        pairs, pair_counts = np.unique(np.column_stack((clusters, batch[:, -1])), axis=0, return_counts=True)
+        for (cluster, label), count in zip(pairs, pair_counts):
+            key = (int(cluster), label)
+            counts[key] = counts.get(key, 0) + int(count)
+    return counts
+
+def majority_labels(counts, k):
+
+    #most common label of each cluster, ties go to the smallest label, -1 for empty clusters
+    cluster_labels = np.full(k, -1.0)
+    best = np.zeros(k, dtype=int)
+    for (cluster, label), count in sorted(counts.items()):
+        if count > best[cluster]:
+            best[cluster] = count
+            cluster_labels[cluster] = label
+    return cluster_labels
+
+def classify_file(filename, centroids, cluster_labels, batch_size):
+
+    correct_count = 0
+    for batch in read_batches(filename, batch_size):
+        predicted_labels = cluster_labels[nearest_centroids(batch[:, :-1], centroids)]
+        correct_count += int(np.count_nonzero(predicted_labels == batch[:, -1]))
+    return correct_count
+
+def minibatch_kmeans(k, training_file, batch_size=1024, epochs=1, init="kmeans++", rng=None):
+    """
+    Trains kmeans by streaming the training file in batches.
+
+    Args:
+        k (int): Number of clusters.
+        training_file (str): Records with the label in the last column.
+        batch_size (int): Rows read and used per centroid update.
+        epochs (int): Passes over the training file.
+        init (str): Seeding method used on the first batch ("first", "random" or "kmeans++").
+        rng (int, np.random.Generator or None): Randomness for the seeding.
+
+    Returns:
+        tuple: (cluster_labels, centroids) in the same form kmeans.kmeans returns them.
+    """
+    centroids = None
+    counts = np.zeros(k, dtype=np.int64)
+
+    for _ in range(epochs):
+        for batch in read_batches(training_file, batch_size):
+            if centroids is None:
+                if len(batch) < k:
+                    raise ValueError(f"First batch has {len(batch)} rows, need at least k={k} to seed the centroids")
+                centroids = initial_centroids(batch, k, init, rng).astype(float)
+            partial_fit(centroids, counts, batch)
+
+    if centroids is None:
+        raise ValueError(f"No training data in {training_file}")
+
+    #assign class labels to clusters
+    cluster_labels = majority_labels(label_counts(training_file, centroids, batch_size), k)
+
+    return cluster_labels, centroids
+
+def main():
+    parser = argparse.ArgumentParser(description="Mini-batch kmeans over a training file read in batches.")
+    parser.add_argument("training", help="records with the label in the last column")
+    parser.add_argument("k", type=int, help="number of clusters")
+    parser.add_argument("--validation", default=None, help="validation records, prints how many are classified correctly")
+    parser.add_argument("--batch-size", type=int, default=1024, help="rows per update")
+    parser.add_argument("--epochs", type=int, default=1, help="passes over the training file")
+    parser.add_argument("--init", choices=INIT_METHODS, default="kmeans++", help="centroid seeding on the first batch")
+    parser.add_argument("--seed", type=int, default=None, help="seed for the centroid seeding")
+    parser.add_argument("--centroids", default=None, help="output centroid file (default centroids_minibatch_K.txt)")
+    parser.add_argument("--labels", default=None, help="output cluster label file (default cluster_labels_minibatch_K.txt)")
+    args = parser.parse_args()
+
+    cluster_labels, centroids = minibatch_kmeans(args.k, args.training, args.batch_size, args.epochs, args.init, args.seed)
+
+    data_to_file(cluster_labels, args.labels or "cluster_labels_minibatch_" + str(args.k) + ".txt")
+    data_to_file(centroids, args.centroids or "centroids_minibatch_" + str(args.k) + ".txt")
+
+    if args.validation:
+        #output correctly classified samples
+        print(classify_file(args.validation, centroids, cluster_labels, args.batch_size))
+
+if __name__ == "__main__":
+    main()
@@ -1,23 +1,29 @@
 #Joseph Saunderson
 #File to convert labels into ranges
+#python reassign_labels.py [ranges.txt] [cluster_labels_31_65.txt] [cluster_labels_ranges_31_65.txt]
 
-ranges_infile = open("ranges.txt", "r")
+import os
+import sys
 
-list_of_tuples_ranges = []
+import numpy as np
 
-for line in ranges_infile:
-    parts = line.split(" ")
-    list_of_tuples_ranges.append((float(parts[0]),float(parts[1])))
+#price ranges are shared with final_prep.py and the predictor in Helper_Functions
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..', 'Helper_Functions'))
+from range_index import RangeIndex
 
+ranges_file = sys.argv[1] if len(sys.argv) > 1 else "ranges.txt"
+label_file = sys.argv[2] if len(sys.argv) > 2 else "cluster_labels_31_65.txt"
+cluster_file = sys.argv[3] if len(sys.argv) > 3 else "cluster_labels_ranges_31_65.txt"
 
-ranges_infile.close()
-label_infile = open("cluster_labels_31_65.txt", "r")
-cluster_outfile = open("cluster_labels_ranges_31_65.txt", "w")
+range_index = RangeIndex.from_file(ranges_file)
+labels = np.loadtxt(label_file, ndmin=1)
 
-for label in label_infile:
-    for x,y in list_of_tuples_ranges:
-        if x <= float(label) < y:
-            cluster_outfile.write(str(x) + " " + str(y) +"\n")
+#lower and upper edge of the range of every label at once, nan for labels outside every range (empty clusters)
+lower, upper = range_index.bounds(labels)
 
-label_infile.close()
-cluster_outfile.close()
\ No newline at end of file
+cluster_outfile = open(cluster_file, "w")
+
+for x, y in zip(lower, upper):
+    cluster_outfile.write(str(x) + " " + str(y) +"\n")
+
+cluster_outfile.close()
@@ -0,0 +1,278 @@
+#Hyperparameter search over k and the validation size
+#Instead of one 100-run sweep per k by hand and comparing answers_* folders, this tries many
+#(k, validation size) configurations in one command:
+#  grid     every combination of the given k and validation values, --runs restarts each
+#  random   --trials combinations picked at random, --runs restarts each
+#  halving  successive halving: every combination starts with --min-runs restarts, only the best
+#           1/--eta of them get --eta times more restarts, until one is left or --runs is reached
+#
+#The records are loaded and scaled once and placed in shared memory for all trials, and the trials
+#run in parallel on all cores. Within a trial, a restart whose partial validation score falls more
+#than --prune-margin (share of the validation records) below the trial's best so far is stopped
+#early. Configurations are ranked by their mean validation accuracy over all restarts, and every
+#configuration is saved as a sweep in the sweep store (sweep_store.py). With --ranges, the best run
+#of the best configuration is exported as a model file.
+#
+#python3 search.py merged_players_final.txt --k-range 30 80 5 --validation 30 40 50 --strategy halving --seed 0 --ranges ranges.txt
+#python3 search.py merged_players_final.txt --k 40 50 65 --validation 40 --strategy grid --runs 100 --seed 0
+
+import argparse
+import itertools
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import shared_memory
+
+import numpy as np
+
+from kmeans import ALGORITHMS, INIT_METHODS, MAX_ITER, kmeans_run, make_splits
+
+#the model artifact and price ranges are shared with the predictor in Helper_Functions
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "Helper_Functions"))
+from feature_registry import FEATURE_SETS, feature_names
+from feature_scaling import SCALING_METHODS, FeatureScaler
+from range_index import RangeIndex
+from sweep_store import DEFAULT_STORE, SweepStore
+from table_store import load_matrix
+
+#search strategies accepted by search
+STRATEGIES = ("grid", "random", "halving")
+
+#records shared by every trial, attached once per worker process
+_search_memory = None
+_search_data = None
+
+def _attach_search_data(name, shape, dtype):
+    global _search_memory, _search_data
+
+    _search_memory = shared_memory.SharedMemory(name=name)
+    _search_data = np.ndarray(shape, dtype=dtype, buffer=_search_memory.buf)
+
+def run_trial(data, k, validation, runs, seed, first_run=0, prune_margin=None, check_every=2, **options):
+    """
+    Runs the restarts of one configuration one after another, stopping clearly worse restarts early.
+
+    Args:
+        data (np.ndarray): All records, label in the last column.
+        k (int): Number of clusters.
+        validation (int): Validation records per restart.
+        runs (int): Number of restarts.
+        seed (np.random.SeedSequence): Seed of this trial's splits and seeding.
+        first_run (int): Number of the first restart, when a trial continues an earlier one.
+        prune_margin (float or None): Share of the validation records a restart may fall below the
+            best finished restart before it is stopped, None never stops a restart.
+        check_every (int): Iterations between the partial validation scores.
+        **options: Passed on to kmeans_run (init, max_iter, tol, algorithm).
+
+    Returns:
+        list of dict: One kmeans_run result per restart, with its "run" number.
+    """
+    splits = make_splits(len(data), validation, runs, seed)
+    run_seeds = seed.spawn(runs)
+
+    results = []
+    best = None
+    for run, ((train, test), run_seed) in enumerate(zip(splits, run_seeds), start=first_run):
+        min_count = None if best is None or prune_margin is None else best - prune_margin * validation
+        result = kmeans_run(k, data[train], data[test], rng=run_seed, min_count=min_count, check_every=check_every,
+                            **options)
+        result["run"] = run
+        results.append(result)
+        if not result["pruned"]:
+            best = result["count"] if best is None else max(best, result["count"])
+    return results
+
+def _run_trial(k, validation, runs, seed, first_run, options):
+
+    return run_trial(_search_data, k, validation, runs, seed, first_run, **options)
+
+def score(results, validation):
+    #mean validation accuracy over all restarts, stopped restarts with their partial score
+    return np.mean([result["count"] for result in results]) / validation
+
+def search(data, configs, strategy="grid", runs=100, min_runs=10, eta=3, seed=None, workers=None, **options):
+    """
+    Runs kmeans trials over (k, validation size) configurations, all trials sharing one copy of the data.
+
+    Args:
+        data (np.ndarray): All records, label in the last column.
+        configs (list of tuple): (k, validation size) configurations to try.
+        strategy (str): "grid" and "random" give every configuration `runs` restarts, "halving"
+            starts with min_runs and gives eta times more to the best 1/eta of the configurations.
+            For "random", pick the configurations with sample_configs.
+        runs (int): Restarts per configuration, the most any configuration gets with "halving".
+        min_runs (int): Restarts of every configuration in the first round of "halving".
+        eta (int): Share of configurations kept (1/eta) and growth of the restarts in "halving".
+        seed (int or None): Seed of every split and seeding, the same seed gives the same search.
+        workers (int or None): Worker processes, 1 runs everything in this process.
+        **options: Passed on to run_trial (prune_margin, check_every, init, max_iter, tol, algorithm).
+
+    Returns:
+        dict: (k, validation) -> list of its kmeans_run results, run numbers counting up across rounds.
+    """
+    if strategy not in STRATEGIES:
+        raise ValueError(f"Unknown strategy '{strategy}', expected one of: {', '.join(STRATEGIES)}")
+
+    data = np.ascontiguousarray(data, dtype=float)
+    entropy = np.random.SeedSequence(seed).entropy
+
+    #restarts every configuration has after each round, the last round always reaches runs
+    totals = [runs]
+    if strategy == "halving":
+        if eta < 2:
+            raise ValueError("successive halving needs eta of at least 2")
+        rounds, remaining = 1, len(configs)
+        while remaining > 1:
+            remaining = max(1, remaining // eta)
+            rounds += 1
+        totals = sorted({min(min_runs * eta ** i, runs) for i in range(rounds - 1)} | {runs})
+
+    memory = None
+    pool = None
+    try:
+        if workers != 1:
+            memory = shared_memory.SharedMemory(create=True, size=data.nbytes)
+            np.ndarray(data.shape, dtype=data.dtype, buffer=memory.buf)[:] = data
+            pool = ProcessPoolExecutor(max_workers=workers, initializer=_attach_search_data,
+                                       initargs=(memory.name, data.shape, data.dtype))
+
+        results = {config: [] for config in configs}
+        alive = list(configs)
+        done = 0
+        for round_number, total in enumerate(totals):
+            #independent stream per configuration and round, the same for every worker count
+            trials = [(config, np.random.SeedSequence([entropy, config[0], config[1], round_number]))
+                      for config in alive]
+            if pool is None:
+                outputs = [run_trial(data, k, validation, total - done, trial_seed, done, **options)
+                           for (k, validation), trial_seed in trials]
+            else:
+                futures = [pool.submit(_run_trial, k, validation, total - done, trial_seed, done, options)
+                           for (k, validation), trial_seed in trials]
+                outputs = [future.result() for future in futures]
+
+            for (config, _), output in zip(trials, outputs):
+                results[config].extend(output)
+            done = total
+
+            #keep the best 1/eta of the configurations for the next round
+            if strategy == "halving" and round_number < len(totals) - 1:
+                ranked = sorted(alive, key=lambda config: -score(results[config], config[1]))
+                alive = ranked[:max(1, len(alive) // eta)]
+    finally:
+        if pool is not None:
+            pool.shutdown()
+        if memory is not None:
+            memory.close()
+            memory.unlink()
+
+    return results
+
+def sample_configs(configs, trials, seed=None):
+    #trials configurations picked at random without repeats, in their original order
+    if trials >= len(configs):
+        return list(configs)
+    picked = np.random.default_rng(seed).choice(len(configs), size=trials, replace=False)
+    return [configs[i] for i in sorted(picked)]
+
+def main():
+    parser = argparse.ArgumentParser(description="Search k and the validation size for kmeans in one command.")
+    parser.add_argument("data", help="records with the label in the last column (merged_players_final.txt or .parquet/.arrow)")
+    parser.add_argument("--k", type=int, nargs="+", default=None, help="numbers of clusters to try")
+    parser.add_argument("--k-range", type=int, nargs=3, metavar=("START", "STOP", "STEP"), default=None,
+                        help="numbers of clusters from START to STOP (included) in steps of STEP")
+    parser.add_argument("--validation", type=int, nargs="+", default=[40], help="validation sizes to try")
+    parser.add_argument("--strategy", choices=STRATEGIES, default="halving", help="how configurations are tried")
+    parser.add_argument("--runs", type=int, default=100, help="restarts per configuration (most with halving)")
+    parser.add_argument("--trials", type=int, default=10, help="configurations tried by --strategy random")
+    parser.add_argument("--min-runs", type=int, default=10, help="restarts of every configuration in the first halving round")
+    parser.add_argument("--eta", type=int, default=3, help="halving keeps the best 1/eta and gives them eta times the restarts")
+    parser.add_argument("--prune-margin", type=float, default=0.15,
+                        help="stop a restart whose partial score is this share of the validation records below the trial's best")
+    parser.add_argument("--no-prune", action="store_true", help="finish every restart")
+    parser.add_argument("--check-every", type=int, default=2, help="iterations between partial validation scores")
+    parser.add_argument("--seed", type=int, default=None, help="seed for the splits, seeding and random configurations")
+    parser.add_argument("--workers", type=int, default=None, help="worker processes (default: all cores)")
+    parser.add_argument("--init", choices=INIT_METHODS, default="first", help="centroid seeding")
+    parser.add_argument("--max-iter", type=int, default=MAX_ITER, help="iteration cap per run")
+    parser.add_argument("--tol", type=float, default=0.0, help="centroid shift that counts as converged")
+    parser.add_argument("--algorithm", choices=ALGORITHMS, default="lloyd", help="cluster assignment method")
+    parser.add_argument("--features", choices=FEATURE_SETS, default="default", help="feature set of the records, stored in the model file")
+    parser.add_argument("--scaling", choices=SCALING_METHODS, default="none", help="feature scaling, fitted on all the records before the training/validation split")
+    parser.add_argument("--weights", type=float, nargs="+", default=None, help="weight of every feature after scaling")
+    parser.add_argument("--store", default=DEFAULT_STORE, help="sweep store (sweep_store.py) every configuration is saved to")
+    parser.add_argument("--model", default=None, help="model file (.npz) for the best run, default model_<run>_<k>.npz, needs --ranges")
+    parser.add_argument("--ranges", default=None, help="ranges.txt from final_prep.py, stored with the sweeps and the model file")
+    args = parser.parse_args()
+
+    ks = list(args.k or [])
+    if args.k_range:
+        start, stop, step = args.k_range
+        ks += list(range(start, stop + 1, step))
+    if not ks:
+        parser.error("give the numbers of clusters with --k or --k-range")
+    if args.model and not args.ranges:
+        parser.error("--model needs --ranges")
+
+    #the records are loaded and scaled once for every trial
+    data = load_matrix(args.data)
+    features = feature_names(args.features)
+    if len(features) != data.shape[1] - 1:
+        if args.ranges:
+            parser.error(f"the '{args.features}' feature set has {len(features)} features, the records have {data.shape[1] - 1}")
+        features = None
+    if args.weights and len(args.weights) != data.shape[1] - 1:
+        parser.error(f"--weights needs one weight per feature ({data.shape[1] - 1})")
+    #fitted on all the records before make_splits, like kmeans.py sweep: every trial's
+    #validation rows share the scaling statistics and the sweep stores a single scaler
+    scaler = FeatureScaler.fit(data[:, :-1], args.scaling, args.weights)
+    data = np.column_stack((scaler.transform(data[:, :-1]), data[:, -1]))
+
+    configs = [(k, validation) for k, validation in itertools.product(sorted(set(ks)), sorted(set(args.validation)))
+               if validation < len(data) and k <= len(data) - validation]
+    if not configs:
+        parser.error("no configuration leaves enough training records for k")
+    if args.strategy == "random":
+        configs = sample_configs(configs, args.trials, args.seed)
+
+    options = {"init": args.init, "max_iter": args.max_iter, "tol": args.tol, "algorithm": args.algorithm}
+    start = time.perf_counter()
+    results = search(data, configs, args.strategy, args.runs, args.min_runs, args.eta, args.seed, args.workers,
+                     prune_margin=None if args.no_prune else args.prune_margin, check_every=args.check_every,
+                     **options)
+    seconds = time.perf_counter() - start
+
+    #one sweep per configuration, finished restarts only, best configuration first
+    #(with halving, the configurations that reached the last round rank before the ones dropped earlier)
+    range_edges = RangeIndex.from_file(args.ranges).edges if args.ranges else None
+    ranked = sorted(configs, key=lambda config: (-len(results[config]), -score(results[config], config[1])))
+    store = SweepStore(args.store)
+    sweep_ids = {}
+    print("k validation restarts pruned accuracy best")
+    for k, validation in ranked:
+        config_results = results[(k, validation)]
+        finished = [result for result in config_results if not result["pruned"]]
+        pruned = len(config_results) - len(finished)
+        sweep_options = dict(options, scaling=args.scaling, weights=args.weights, feature_set=args.features,
+                             search=args.strategy, pruned=pruned)
+        sweep_ids[(k, validation)] = store.add_sweep(finished, args.data, k, validation, args.seed, sweep_options,
+                                                     features, scaler, range_edges)
+        print(k, validation, len(config_results), pruned, round(score(config_results, validation), 4),
+              max(result["count"] for result in finished))
+
+    total_runs = sum(len(config_results) for config_results in results.values())
+    print(f"{total_runs} restarts in {seconds:.1f}s, saved to {args.store}")
+
+    best_k, best_validation = ranked[0]
+    best = store.best_runs(sweep_id=sweep_ids[ranked[0]], limit=1)[0]
+    print("best configuration: k =", best_k, "validation =", best_validation, "sweep", best["sweep_id"], "run", best["run"])
+
+    if args.ranges:
+        model = args.model or "model_" + str(best["run"]) + "_" + str(best_k) + ".npz"
+        store.export_model(model, best["sweep_id"], best["run"])
+        print("best run", best["run"], "saved to", model)
+    store.close()
+
+if __name__ == "__main__":
+    main()
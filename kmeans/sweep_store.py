@@ -0,0 +1,248 @@
+#Sweep results store
+#Keeps every run of every kmeans sweep in one SQLite file instead of three small text files per run
+#(answer_K_clusters_i.txt, centroidsI_K.txt, cluster_labels_I_K.txt) that after_kmeans.sh sorts into folders
+#and avg.py reads back one by one.
+#
+#sweeps: one row per sweep, with its data file, k, validation size, seed, kmeans options, feature set,
+#        feature scaling and (when given) the price range edges
+#runs:   one row per run, with its score (correctly classified validation records), iterations,
+#        seconds, and the centroids and cluster labels as .npy blobs
+#
+#The best run is found with one query and exported as a model file (model_artifact.py):
+#python3 sweep_store.py kmeans_sweeps.sqlite list
+#python3 sweep_store.py kmeans_sweeps.sqlite best --k 50 --top 5
+#python3 sweep_store.py kmeans_sweeps.sqlite export model.npz --k 50 --ranges ranges.txt
+
+import argparse
+import io
+import json
+import os
+import sqlite3
+import sys
+import time
+
+import numpy as np
+
+#the model artifact and price ranges are shared with the predictor in Helper_Functions
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "Helper_Functions"))
+from feature_scaling import FeatureScaler
+from model_artifact import save_model
+from range_index import RangeIndex
+
+#file used by kmeans.py sweep when no other is given
+DEFAULT_STORE = "kmeans_sweeps.sqlite"
+
+#runs are ranked by validation accuracy, so sweeps with different validation sizes compare
+ACCURACY = "CAST(runs.score AS REAL) / sweeps.validation"
+
+def to_blob(array):
+    #array as the bytes of a .npy file, no pickling
+    buffer = io.BytesIO()
+    np.save(buffer, np.asarray(array), allow_pickle=False)
+    return buffer.getvalue()
+
+def from_blob(blob):
+    return None if blob is None else np.load(io.BytesIO(blob), allow_pickle=False)
+
+class SweepStore:
+    """
+    SQLite file holding the parameters and results of kmeans sweeps.
+    """
+
+    def __init__(self, path=DEFAULT_STORE):
+        self.path = path
+        self.connection = sqlite3.connect(path)
+        self.connection.row_factory = sqlite3.Row
+        with self.connection:
+            self.connection.execute(
+                "CREATE TABLE IF NOT EXISTS sweeps ("
+                " id INTEGER PRIMARY KEY, created_at REAL, data TEXT, k INTEGER, validation INTEGER,"
+                " runs INTEGER, seed INTEGER, options TEXT, features TEXT, scaling_method TEXT,"
+                " feature_center BLOB, feature_scale BLOB, feature_weights BLOB, range_edges BLOB)"
+            )
+            self.connection.execute(
+                "CREATE TABLE IF NOT EXISTS runs ("
+                " sweep_id INTEGER REFERENCES sweeps(id), run INTEGER, score INTEGER, iterations INTEGER,"
+                " seconds REAL, skipped_distances INTEGER, centroids BLOB, cluster_labels BLOB,"
+                " PRIMARY KEY (sweep_id, run))"
+            )
+
+    def add_sweep(self, results, data, k, validation, seed=None, options=None, features=None,
+                  scaler=None, range_edges=None):
+        """
+        Stores a sweep and all of its runs in one transaction.
+
+        Args:
+            results (list of dict): kmeans_run results with their "run" number, as returned by sweep.
+            data (str): Records file the sweep was run on.
+            k (int): Number of clusters.
+            validation (int): Validation records per run.
+            seed (int or None): Seed of the random splits.
+            options (dict or None): kmeans options (init, max_iter, tol, algorithm, ...).
+            features (list of str or None): Feature order of the centroid columns.
+            scaler (FeatureScaler or None): Scaling the centroids were trained in.
+            range_edges (np.ndarray or None): Price range edges, needed to export a model.
+
+        Returns:
+            int: Id of the new sweep.
+        """
+        n_features = results[0]["centroids"].shape[1]
+        scaler = scaler or FeatureScaler.identity(n_features)
+        with self.connection:
+            sweep_id = self.connection.execute(
+                "INSERT INTO sweeps (created_at, data, k, validation, runs, seed, options, features, scaling_method,"
+                " feature_center, feature_scale, feature_weights, range_edges) VALUES (?,?,?,?,?,?,?,?,?,?,?,?,?)",
+                (time.time(), data, k, validation, len(results), seed, json.dumps(options or {}),
+                 json.dumps(list(features) if features is not None else None), scaler.method,
+                 to_blob(scaler.center), to_blob(scaler.scale), to_blob(scaler.weights),
+                 None if range_edges is None else to_blob(range_edges))
+            ).lastrowid
+            self.connection.executemany(
+                "INSERT INTO runs (sweep_id, run, score, iterations, seconds, skipped_distances, centroids, cluster_labels)"
+                " VALUES (?,?,?,?,?,?,?,?)",
+                [(sweep_id, result["run"], int(result["count"]), int(result["iterations"]),
+                  result.get("seconds"), int(sum(result.get("skipped_distances", []))),
+                  to_blob(result["centroids"]), to_blob(result["cluster_labels"])) for result in results]
+            )
+        return sweep_id
+
+    def sweeps(self):
+        """One dict per sweep, with the mean and best score of its runs, newest first."""
+        rows = self.connection.execute(
+            "SELECT sweeps.id, sweeps.created_at, sweeps.data, sweeps.k, sweeps.validation, sweeps.runs,"
+            " sweeps.seed, sweeps.options, sweeps.scaling_method, AVG(runs.score) AS mean_score,"
+            " MAX(runs.score) AS best_score, SUM(runs.seconds) AS seconds"
+            " FROM sweeps JOIN runs ON runs.sweep_id = sweeps.id GROUP BY sweeps.id ORDER BY sweeps.id DESC"
+        ).fetchall()
+        return [dict(row) for row in rows]
+
+    def summary(self, sweep_id):
+        """Mean score, best score and best run of a sweep, what avg.py printed."""
+        row = self.connection.execute(
+            "SELECT AVG(score) AS mean_score, MAX(score) AS best_score FROM runs WHERE sweep_id=?", (sweep_id,)
+        ).fetchone()
+        best = self.best_runs(sweep_id=sweep_id, limit=1)
+        return {"mean_score": row["mean_score"], "best_score": row["best_score"],
+                "best_run": best[0]["run"] if best else None}
+
+    def best_runs(self, sweep_id=None, k=None, validation=None, limit=1):
+        """
+        Runs with the highest validation accuracy, optionally of one sweep, k or validation size.
+        Ties go to the earlier run, as the argmax of avg.py did.
+
+        Returns:
+            list of dict: sweep_id, run, k, validation, score, accuracy, iterations and seconds.
+        """
+        filters, values = [], []
+        for column, value in (("sweeps.id", sweep_id), ("sweeps.k", k), ("sweeps.validation", validation)):
+            if value is not None:
+                filters.append(column + "=?")
+                values.append(value)
+        where = " WHERE " + " AND ".join(filters) if filters else ""
+        rows = self.connection.execute(
+            "SELECT runs.sweep_id, runs.run, sweeps.k, sweeps.validation, runs.score, " + ACCURACY + " AS accuracy,"
+            " runs.iterations, runs.seconds FROM runs JOIN sweeps ON runs.sweep_id = sweeps.id" + where +
+            " ORDER BY accuracy DESC, runs.sweep_id, runs.run LIMIT ?",
+            values + [limit]
+        ).fetchall()
+        return [dict(row) for row in rows]
+
+    def load_run(self, sweep_id, run):
+        """
+        Loads one run with everything needed to rebuild its model.
+
+        Returns:
+            dict: "centroids", "cluster_labels", "score", "seed", "features" (None if unknown),
+            "scaler" and "range_edges" (None if the sweep was stored without ranges).
+        """
+        row = self.connection.execute(
+            "SELECT runs.*, sweeps.seed, sweeps.features, sweeps.scaling_method, sweeps.feature_center,"
+            " sweeps.feature_scale, sweeps.feature_weights, sweeps.range_edges"
+            " FROM runs JOIN sweeps ON runs.sweep_id = sweeps.id WHERE runs.sweep_id=? AND runs.run=?",
+            (sweep_id, run)
+        ).fetchone()
+        if row is None:
+            raise KeyError(f"No run {run} in sweep {sweep_id} of {self.path}")
+        return {
+            "centroids": from_blob(row["centroids"]),
+            "cluster_labels": from_blob(row["cluster_labels"]),
+            "score": row["score"],
+            "seed": row["seed"],
+            "features": json.loads(row["features"]),
+            "scaler": FeatureScaler(from_blob(row["feature_center"]), from_blob(row["feature_scale"]),
+                                    from_blob(row["feature_weights"]), row["scaling_method"]),
+            "range_edges": from_blob(row["range_edges"]),
+        }
+
+    def export_model(self, path, sweep_id=None, run=None, range_edges=None, **filters):
+        """
+        Writes a run as a model file, the best run (of the sweep or filters) if run is None.
+        range_edges is needed if the sweep was stored without them.
+
+        Returns:
+            dict: The exported run, as returned by best_runs.
+        """
+        if run is None:
+            best = self.best_runs(sweep_id=sweep_id, limit=1, **filters)
+            if not best:
+                raise ValueError(f"No runs in {self.path} match the selection")
+            sweep_id, run = best[0]["sweep_id"], best[0]["run"]
+        stored = self.load_run(sweep_id, run)
+
+        range_edges = stored["range_edges"] if range_edges is None else range_edges
+        if range_edges is None:
+            raise ValueError(f"Sweep {sweep_id} was stored without price ranges, pass the ranges file")
+
+        options = {} if stored["features"] is None else {"features": stored["features"]}
+        save_model(path, stored["centroids"], stored["cluster_labels"], range_edges,
+                   seed=stored["seed"], score=stored["score"], scaler=stored["scaler"], **options)
+        return {"sweep_id": sweep_id, "run": run, "score": stored["score"]}
+
+    def close(self):
+        self.connection.close()
+
+def main():
+    parser = argparse.ArgumentParser(description="Query kmeans sweep results and export the best model.")
+    parser.add_argument("store", help="sweep store written by kmeans.py sweep")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    commands.add_parser("list", help="every sweep with its mean and best score")
+
+    for name in ("best", "export"):
+        command = commands.add_parser(name, help="best runs" if name == "best" else "write the best run as a model file")
+        if name == "export":
+            command.add_argument("output", help="model file to write (.npz)")
+            command.add_argument("--run", type=int, default=None, help="export this run of --sweep instead of the best")
+            command.add_argument("--ranges", default=None, help="ranges.txt, if the sweep was stored without it")
+        else:
+            command.add_argument("--top", type=int, default=10, help="number of runs to show")
+        command.add_argument("--sweep", type=int, default=None, help="only runs of this sweep")
+        command.add_argument("--k", type=int, default=None, help="only sweeps with this number of clusters")
+        command.add_argument("--validation", type=int, default=None, help="only sweeps with this validation size")
+
+    args = parser.parse_args()
+    store = SweepStore(args.store)
+
+    if args.command == "list":
+        for sweep in store.sweeps():
+            print(f"sweep {sweep['id']}: k={sweep['k']} validation={sweep['validation']} runs={sweep['runs']} "
+                  f"seed={sweep['seed']} scaling={sweep['scaling_method']} mean={sweep['mean_score']:.2f} "
+                  f"best={sweep['best_score']} ({sweep['data']})")
+
+    elif args.command == "best":
+        for run in store.best_runs(args.sweep, args.k, args.validation, args.top):
+            print(f"sweep {run['sweep_id']} run {run['run']}: k={run['k']} score={run['score']}/{run['validation']} "
+                  f"iterations={run['iterations']}")
+
+    else:
+        if args.run is not None and args.sweep is None:
+            parser.error("--run needs --sweep")
+        range_edges = RangeIndex.from_file(args.ranges).edges if args.ranges else None
+        exported = store.export_model(args.output, args.sweep, args.run, range_edges,
+                                      k=args.k, validation=args.validation)
+        print(f"sweep {exported['sweep_id']} run {exported['run']} (score {exported['score']}) saved to {args.output}")
+
+    store.close()
+
+if __name__ == "__main__":
+    main()
@@ -2,39 +2,57 @@
 # 07/30/2025
 # This program takes input of a csv file of combined stats on players and cleans it up to be in the correct format
 # k-means clustering algorithm and then outputs it to a txt file.
+# The csv is read in chunks and only the columns used for clustering are loaded, so memory does not grow
+# with the size of the file and extra scraped columns are simply ignored.
+# The input and output can also be Parquet or Arrow files (.parquet/.arrow, see table_store.py);
+# a columnar output keeps the column names and dtypes for final_prep.py.
+# Which features are written, and how derived ones (per-90 rates, contract years, position) are
+# computed, is defined in Helper_Functions/feature_registry.py.
 
 # data_sort.py
 
-import pandas as pd
-
-def remove_columns_nan(data, columns_to_remove):
-    data_cleaned = data.drop(columns=columns_to_remove)
-    new_order = ['Age', 'time', 'xA', 'xG', 'Value']
-    return data_cleaned[new_order].dropna()
-
-def convert_price(dataframe, outfile):
-    for line in dataframe:
-        price = line[-1]
-        price = price.strip('€')
-        if price[-1] == 'm':
-            price = price.strip('m').split('.')
-            price = price[0] + price[1] + "0000"
-        elif price[-1] == 'k':
-            price = price.strip('k')
-            price += "000"
-        line[-1] = price
-        output_string = ' '.join(line)
-        outfile.write(output_string + '\n')
-
-def clean_and_format_merged_csv(input_csv, output_txt):
-    merged = pd.read_csv(input_csv)
-    columns_to_remove = [
-        "name", "Citizenship", "Contract expiration", "DOB", "Height (m)", "ID", 
-        "Joined", "Last club", "Market value history", "Nationality", "Other positions", 
-        "Position", "Since", "Team", "Transfer history", "Value last updated", 
-        "assists", "games", "goals", "id", "key_passes", "npg", "npxG", "position", 
-        "red_cards", "shots", "source", "team", "team_title", "xGBuildup", "xGChain", "yellow_cards"
-    ]
-    cleaned_df = remove_columns_nan(merged, columns_to_remove).astype(str)
+import os
+import sys
+
+# The market value parser is shared with the predictor in Helper_Functions
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'Helper_Functions'))
+from feature_registry import DEFAULT_FEATURES, compute_features, feature_names, input_dtypes
+from price_parser import parse_market_values
+from table_store import iter_tables, table_columns, table_format, write_tables
+
+# Rows read from the merged csv at a time
+CHUNK_SIZE = 100_000
+
+def remove_columns_nan(data, features=DEFAULT_FEATURES):
+    return data[feature_names(features) + ['Value']].dropna()
+
+def clean_chunk(chunk, features=DEFAULT_FEATURES):
+    # every feature of the chunk in one vectorized pass, then the price
+    cleaned = compute_features(chunk, features).assign(Value=chunk['Value'])
+    cleaned = remove_columns_nan(cleaned, features).copy()
+    # '€28.58m' -> 28580000, '€450k' -> 450000, '€1.20bn' -> 1200000000
+    cleaned['Value'] = parse_market_values(cleaned['Value'])
+    # drop prices that could not be read
+    return cleaned.dropna(subset=['Value'])
+
+def clean_and_format_merged_csv(input_csv, output_txt, chunksize=CHUNK_SIZE, features=DEFAULT_FEATURES):
+    # only the scraped columns the features read, numbers as float in every chunk, whether or not
+    # that chunk has missing values; columns the file does not have count as missing for every player
+    present = set(table_columns(input_csv))
+    dtypes = {column: dtype for column, dtype in input_dtypes(features).items() if column in present}
+    if table_format(input_csv) == 'csv':
+        # prices stay text for the parser, a columnar file keeps the dtype it was written with
+        dtypes['Value'] = str
+    else:
+        dtypes = {column: dtype for column, dtype in dtypes.items() if dtype is float}
+    columns = [column for column in input_dtypes(features) if column in present] + ['Value']
+    chunks = iter_tables(input_csv, columns=columns, dtype=dtypes, chunksize=chunksize)
+
+    if table_format(output_txt) not in ('csv', 'text'):
+        # every cleaned chunk is appended to the columnar file as it is read, memory stays bounded
+        write_tables((clean_chunk(chunk, features) for chunk in chunks), output_txt)
+        return
+
     with open(output_txt, 'w') as outfile:
-        convert_price(cleaned_df.values.tolist(), outfile)
\ No newline at end of file
+        for chunk in chunks:
+            clean_chunk(chunk, features).to_csv(outfile, sep=' ', header=False, index=False, lineterminator='\n')
@@ -3,6 +3,7 @@ scraper_fbref.py
 
 This program defines a class to scrape player, team, and schedule data from FBref using the soccerdata library.
 The data is returned as pandas DataFrames with source identifiers included.
+The tables of a league and season can be kept in an on-disk cache (see scrape_cache.py).
 
 Author: Marcos Wofford
 """
@@ -24,6 +25,7 @@ class FBrefDataScraper:
         self.scraper = None
         self.league = None
         self.seasons = None
+        self.cache = None     # Optional ScrapeCache, None = always download
 
     def initialize_scraper(self):
         """
@@ -32,6 +34,15 @@ class FBrefDataScraper:
         """
         self.scraper = FBref(leagues=self.league, seasons=self.seasons)
 
+    def read_table(self, entity, read):
+        """
+        Function to read one table, from the cache when one is set.
+        """
+        if self.cache:
+            seasons = ",".join(str(season) for season in self.seasons)
+            return self.cache.get_or_fetch("fbref", self.league, seasons, entity, read)
+        return read()
+
     def scrape_all_data(self):
         """
         Scrapes all available data for the specified league and season:
@@ -44,13 +55,13 @@ class FBrefDataScraper:
         -  Match schedule and results.
         """
         # Scrape player statistics
-        players = self.scraper.read_player_season_stats()
+        players = self.read_table("players", self.scraper.read_player_season_stats)
 
         # Scrape team statistics
-        teams = self.scraper.read_team_season_stats()
+        teams = self.read_table("teams", self.scraper.read_team_season_stats)
 
         # Scrape schedule and results
-        schedule = self.scraper.read_schedule()
+        schedule = self.read_table("schedule", self.scraper.read_schedule)
 
         # Adding a column to show where each DataFrame came from
         players["source"] = "fbref_players"
@@ -1,101 +1,243 @@
 """
-merge_player_data.py 
+merge_player_data.py
 
 Authors: Logan Seitz, Marcos Wofford, Joseph Saunderson
 Date: 08/05/2025
 
-This program merges two CSV files located in the ./data folder.
+This program merges two or more CSV files located in the ./data folder.
 It does the following steps:
-    1. Prompts the user to input the names of two CSV files and the column for player names.
-    2. Loads both CSV files into dictionaries, using player names as the key.
-    3. Merges the two dictionaries, combining stats for matching players and preserving all available data.
-    4. Writes the merged result into a new CSV file.
-        5. Cleans and formats the merged CSV by calling clean_and_format_merged_csv from data_sort
+    1. Prompts the user to input the names of the CSV files and the column for player names
+       (optionally a player ID column, a team column and the season of each file).
+    2. Loads every file into a table with a normalized key per player: the name with case, accents and
+       spacing folded, and the season when one is given.
+    3. Merges all files in one hash join on that key, combining stats for matching players and
+       preserving all available data (the later file wins when both have a value).
+       Repeats of a player in a file (the same ID, or values that agree) are collapsed, the last row
+       winning. Rows of one name with conflicting values are told apart by a fuzzy match of the team
+       column; rows that still cannot be told apart are left out and counted as ambiguous.
+       A link table from record_linkage.py renames a file's players to the names of the first file,
+       so players written differently in the two sources are merged too.
+    4. Writes the merged result into a new CSV file and prints matched, unmatched and ambiguous counts.
+       Inputs and output can also be Parquet or Arrow files (.parquet/.arrow, see table_store.py).
+        5. Cleans and formats the merged CSV by calling clean_and_format_merged_csv from data_sort,
+       with the feature set chosen by the user (feature_registry.py in Helper_Functions)
     6. Outputs the final cleaned and formatted player data into a .txt file.
 
 
 """
 
 
-import csv  
-import os  
+import os
+import re
+import sys
+
+import pandas as pd
 
 # Import the custom data cleaning function from another script
 from data_sort import clean_and_format_merged_csv
+from scrape_cache import season_end_year
+
+# Name normalization and storage formats are shared with the predictor in Helper_Functions
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'Helper_Functions'))
+from feature_registry import FEATURE_SETS, input_dtypes
+from player_index import normalize_name
+from table_store import infer_dtypes, read_table, table_format, write_table
 
 # Setting the directory where input and output CSV files are stored
 DATA_DIR = "data"
 
-# Function to load player data from a CSV file into a dictionary
-def load_csv(filename, key):
-    # Build the full path to the CSV file
+# Key columns added to every source table, removed again before writing
+KEY_COLUMNS = ['_name', '_season', '_team', '_id', '_source']
+
+# Lowest team similarity at which rows of the same name are taken to be the same player
+TEAM_MATCH = 0.6
+
+# Function to read a CSV, Parquet or Arrow file with every value as text, missing values as empty strings
+def read_text_table(path):
+    if table_format(path) != 'csv':
+        return read_table(path).astype('string').fillna('').astype(object)
+    return pd.read_csv(path, dtype=str, keep_default_na=False, skipinitialspace=True, encoding='utf-8-sig')
+
+# Function to fold case, accents and spacing of a whole column of names, each distinct name once
+def normalize_names(names):
+    distinct = pd.unique(names)
+    return names.map(dict(zip(distinct, (normalize_name(name) for name in distinct))))
+
+# Function to check whether a word of a team name is the other word or an abbreviation of it ('bor' of 'borussia', 'rb' of 'rasenballsport')
+def abbreviates(short, long):
+    if len(short) > len(long):
+        short, long = long, short
+    return short[0] == long[0] and re.search('.*'.join(map(re.escape, short)), long) is not None
+
+# Function to score two normalized team names: the share of the shorter name's words matching a word of the other,
+# so 'bor. dortmund' and 'borussia dortmund' score 1.0 and 'union berlin' and 'hertha berlin' 0.5
+def team_similarity(left, right):
+    left_words, right_words = re.findall(r"\w+", left), re.findall(r"\w+", right)
+    if len(left_words) > len(right_words):
+        left_words, right_words = right_words, left_words
+    if not left_words:
+        return 0.0
+    matched = sum(any(abbreviates(word, other) for other in right_words) for word in left_words)
+    return matched / len(left_words)
+
+# Function to load a link table written by record_linkage.py: this file's name -> the first file's name
+def load_links(filename):
+    links = read_text_table(os.path.join(DATA_DIR, filename))
+    return dict(zip(links["right_name"], links["left_name"]))
+
+# Function to load one source file into a table with its join key columns
+def load_source(filename, key, team=None, season=None, source=0, links=None, player_id=None):
+    # Build the full path to the file
     path = os.path.join(DATA_DIR, filename)
-    
-    # Open the CSV file
-    with open(path, newline='', encoding='utf-8-sig') as f:
-        # Read CSV rows as dictionaries (column names are keys)
-        reader = csv.DictReader(f, skipinitialspace=True)
-        
-        rows = {}  # Dictionary to store player data
-        for row in reader:
-            name = row[key].strip()  # Extract and clean the player's name using the specified column
-            
-            # Rename the name column to a consistent 'name'
-            row = {("name" if k == key else k): v for k, v in row.items()}
-            
-            # Store the row under the player name as key
-            rows[name] = row
-        
-        return rows
-
-# Function to merge two dictionaries of player data
-def merge_dicts(base, new):
-    for name, row in new.items():
-        if name in base:
-            # If the player already exists, update missing fields
-            for k, v in row.items():
-                if v:  # Only update if the new value is not empty
-                    base[name][k] = v
+    table = read_text_table(path)
+
+    # Rename the name column to a consistent 'name'
+    table = table.rename(columns={key: "name"})
+    table["name"] = table["name"].str.strip()
+
+    # Linked players take the name they have in the first file
+    if links:
+        table["name"] = table["name"].map(links).fillna(table["name"])
+
+    # Join key: normalized name, the season as its end year ('22/23' and '2022/2023' -> '2023')
+    table["_name"] = normalize_names(table["name"])
+    end_year = season_end_year(season) if season else None
+    table["_season"] = str(end_year) if end_year else ""
+    table["_team"] = normalize_names(table[team]) if team else pd.NA
+    table["_id"] = table[player_id].str.strip().replace('', pd.NA) if player_id else pd.NA
+    table["_source"] = source
+    return table
+
+# Function to tell apart the players behind one name that stands for several players in some source
+def split_players(group, conflicting):
+    """
+    Numbers the players behind the rows of one (name, season) key. Each row of the conflicting
+    sources starts a player; the rows of another source join the player whose team is most
+    similar, or the last player when no team matches (as the later row wins elsewhere).
+    Rows of a conflicting source whose team is unknown or too similar to another of its rows
+    cannot be told apart.
+    Returns: a player number per row, -1 for ambiguous rows.
+    """
+    players, numbers = [], pd.Series(-1, index=group.index)  # sources and teams of each player
+    for source, rows in sorted(group.groupby('_source'), key=lambda item: item[0] not in conflicting):
+        teams = rows['_team'].dropna().tolist()
+        if source in conflicting:
+            for index, team in zip(rows.index, rows['_team']):
+                if pd.notna(team) and sum(team_similarity(team, other) >= TEAM_MATCH for other in teams) == 1:
+                    numbers[index] = len(players)
+                    players.append(({source}, [team]))
+            continue
+
+        candidates = [number for number, (sources, _) in enumerate(players) if source not in sources]
+        scores = {number: max((team_similarity(team, other) for team in teams for other in players[number][1]),
+                              default=0.0) for number in candidates}
+        best = max(scores, key=scores.get, default=None)
+        if best is None:
+            number = len(players)
+            players.append((set(), []))
         else:
-            # If the player is new, just add the full row
-            base[name] = row
-    return base
-
-# Interactive function to merge two CSVs and post-process
+            number = best if scores[best] >= TEAM_MATCH else candidates[-1]
+        players[number][0].add(source)
+        players[number][1].extend(teams)
+        numbers[rows.index] = number
+    return numbers
+
+# Function to merge any number of source tables in one pass
+def merge_sources(tables, features=None):
+    """
+    Joins the source tables on their normalized (name, season) key.
+    Rows of a source with the same player ID, or that are equal, are collapsed to the last one.
+    Rows sharing a key in a source are one player too, unless they hold conflicting values in a
+    column the feature set (feature_registry.py) reads or the price; the players of such a key are
+    told apart by team (split_players), and rows the team does not tell apart are ambiguous and left out.
+    For every column, the value of the last source that has one is kept.
+    Returns: the merged table (name first, other columns sorted) and a dictionary of counts.
+    """
+    rows = pd.concat(tables, ignore_index=True)
+    columns = [column for column in rows.columns if column not in KEY_COLUMNS]
+
+    # Repeats of one player inside a source, the last row wins
+    rows = rows[~(rows['_id'].notna() & rows.duplicated(['_source', '_id'], keep='last'))]
+    rows = rows.drop_duplicates(['_source', '_name', '_season', '_team'] + columns, keep='last')
+
+    # Keys whose rows in one source disagree on a compared value stand for several players
+    keys = ['_source', '_name', '_season']
+    compare = [column for column in list(input_dtypes(features)) + ['Value'] if column in rows.columns]
+    repeated = rows[rows.duplicated(keys, keep=False)]
+    # only the compared values are blanked, a file without a season keeps '' as its season key
+    values = repeated[keys].join(repeated[compare].replace('', None))
+    conflicts = values.groupby(keys, dropna=False).nunique().gt(1).any(axis=1)
+    conflicts = conflicts[conflicts].reset_index()
+    tied = pd.MultiIndex.from_frame(rows[['_name', '_season']]).isin(
+        pd.MultiIndex.from_frame(conflicts[['_name', '_season']]))
+
+    # The players of those keys are numbered apart, every other key is one player
+    rows['_tie'] = 0
+    for (name, season), group in rows[tied].groupby(['_name', '_season']):
+        conflicting = conflicts.loc[(conflicts['_name'] == name) & (conflicts['_season'] == season), '_source']
+        rows.loc[group.index, '_tie'] = split_players(group, set(conflicting))
+    ambiguous = rows['_tie'] < 0
+    rows = rows[~ambiguous]
+
+    # One hash group per player, the last non-empty value of every column wins
+    keys = ['_name', '_season', '_tie']
+    groups = rows[keys + columns].replace('', None).groupby(keys, sort=False, dropna=False)
+    merged = groups.last().reset_index(drop=True).fillna('')
+    sources_per_player = rows.groupby(keys, sort=False, dropna=False)['_source'].nunique().to_numpy()
+
+    # Automatically building a consistent list of columns (field names) across all sources
+    fieldnames = ['name'] + sorted(column for column in columns if column != 'name')
+
+    counts = {
+        "players": len(merged),
+        "matched": int((sources_per_player > 1).sum()),
+        "unmatched": int((sources_per_player == 1).sum()),
+        "ambiguous": int(ambiguous.sum()),
+    }
+    return merged[fieldnames], counts
+
+# Interactive function to merge CSVs and post-process
 def interactive_merge():
     print("\n=== Player Data Merger (from ./data folder) ===")
 
-    sources = []  # List to store input sources (filename and key)
+    count = input("\nHow many files to merge? (default 2): ").strip()
+    count = int(count) if count else 2
 
-    # Asking the user for two CSV files to merge
-    for i in range(2):
+    tables = []  # List of loaded sources
+
+    # Asking the user for the files to merge
+    for i in range(count):
         print(f"\nSource {i + 1}")
         filename = input("Enter CSV filename (ex: understat.csv): ").strip()
         key = input("Enter player name column header (ex: Name or player_name): ").strip()
-        sources.append((filename, key))
+        player_id = input("Enter player ID column header, used for players listed twice (optional, ex: ID): ").strip()
+        team = input("Enter team column header, used for players with the same name (optional): ").strip()
+        season = input("Enter the season of this file (optional, ex: 22/23): ").strip()
+        links = input("Enter a link table from record_linkage.py for this file (optional): ").strip() if i else ""
+        tables.append(load_source(filename, key, team or None, season or None, source=i,
+                                  links=load_links(links) if links else None, player_id=player_id or None))
 
     # Asking user for output filenames
     output_csv = input("\nEnter output CSV filename (ex: merged.csv): ").strip()
     output_txt = input("Enter output TXT filename (ex: merged_format_final_noname.txt): ").strip()
+    features = input(f"Enter the feature set to keep ({', '.join(FEATURE_SETS)}, default: default): ").strip() or 'default'
+    if features not in FEATURE_SETS:
+        print(f"Unknown feature set '{features}', please try again")
+        return
 
     # Creating full paths for saving the output files
     output_csv_path = os.path.join(DATA_DIR, output_csv)
     output_txt_path = os.path.join(DATA_DIR, output_txt)
 
     print("\nMerging files...")
+    merged_data, counts = merge_sources(tables, features)
+    print(f"{counts['players']} players: {counts['matched']} matched, {counts['unmatched']} in one file only, "
+          f"{counts['ambiguous']} ambiguous rows left out")
 
-    # Loading and merging data from the two sources
-    merged_data = load_csv(sources[0][0], sources[0][1])
-    merged_data = merge_dicts(merged_data, load_csv(sources[1][0], sources[1][1]))
-
-    # Automatically building a consistent list of columns (field names) across all player rows
-    fieldnames = ['name'] + sorted({k for row in merged_data.values() for k in row if k != 'name'})
-
-    # Writing the merged data into a new CSV file
-    with open(output_csv_path, 'w', newline='', encoding='utf-8') as f:
-        writer = csv.DictWriter(f, fieldnames=fieldnames)
-        writer.writeheader()
-        writer.writerows(merged_data.values())
+    # Writing the merged data into a new CSV file, or a columnar file with a dtype per column
+    if table_format(output_csv_path) != 'csv':
+        merged_data = infer_dtypes(merged_data)
+    write_table(merged_data, output_csv_path)
 
     print(f"Merged CSV saved to: {output_csv_path}")
 
@@ -103,9 +245,9 @@ def interactive_merge():
 
     # Calling the cleaning function to format and save the merged data to a .txt file
     print("\nCleaning and formatting merged CSV...")
-    clean_and_format_merged_csv(output_csv_path, output_txt_path)
+    clean_and_format_merged_csv(output_csv_path, output_txt_path, features=features)
     print(f"Final formatted TXT saved to: {output_txt_path}")
 
 
 if __name__ == "__main__":
-    interactive_merge()
\ No newline at end of file
+    interactive_merge()
@@ -0,0 +1,95 @@
+"""
+rate_limit.py
+
+This program defines helpers for scraping politely from several threads at once:
+    - TokenBucket: lets through at most `rate` requests per second on average, with short bursts
+    - HostRateLimiter: one token bucket per host, shared by every worker thread
+    - call_with_retries: retries a failing call with exponential backoff
+
+Author: Marcos Wofford
+"""
+
+import random
+import threading
+import time
+from urllib.parse import urlparse
+
+class TokenBucket:
+    """
+    A thread-safe token bucket. Each request takes one token; tokens refill at `rate`
+    per second up to `capacity`.
+    """
+
+    def __init__(self, rate, capacity=None, clock=time.monotonic, sleep=time.sleep):
+        """
+        Function to initialize the bucket.
+
+        Parameters: rate (float): tokens added per second.
+                    capacity (float or None): largest burst, defaults to max(1, rate).
+                    clock, sleep: time functions, replaceable for testing.
+        """
+        if rate <= 0:
+            raise ValueError("rate must be positive")
+        self.rate = rate
+        self.capacity = capacity if capacity is not None else max(1.0, rate)
+        self.tokens = self.capacity
+        self.clock = clock
+        self.sleep = sleep
+        self.last = clock()
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        """
+        Function to wait until a token is available and take it.
+        """
+        while True:
+            with self.lock:
+                now = self.clock()
+                self.tokens = min(self.capacity, self.tokens + (now - self.last) * self.rate)
+                self.last = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait = (1 - self.tokens) / self.rate
+            self.sleep(wait)
+
+class HostRateLimiter:
+    """
+    A token bucket per host, so every worker hitting the same site shares one limit.
+    """
+
+    def __init__(self, rate, capacity=None):
+        """
+        Parameters: rate (float): requests per second allowed per host.
+                    capacity (float or None): largest burst per host.
+        """
+        self.rate = rate
+        self.capacity = capacity
+        self.buckets = {}
+        self.lock = threading.Lock()
+
+    def acquire(self, url_or_host):
+        """
+        Function to wait for a request slot on the host of a URL (or a bare host name).
+        """
+        host = urlparse(url_or_host).netloc or url_or_host
+        with self.lock:
+            bucket = self.buckets.get(host)
+            if bucket is None:
+                bucket = self.buckets[host] = TokenBucket(self.rate, self.capacity)
+        bucket.acquire()
+
+def call_with_retries(func, max_retries=3, backoff=1.0, sleep=time.sleep):
+    """
+    Function to call func(), retrying on any exception.
+    Waits backoff * 2**attempt seconds (plus up to 10% jitter) between attempts.
+    Returns: whatever func returns. Raises the last exception once all retries failed.
+    """
+    for attempt in range(max_retries + 1):
+        try:
+            return func()
+        except Exception:
+            if attempt == max_retries:
+                raise
+            delay = backoff * 2 ** attempt
+            sleep(delay + random.uniform(0, 0.1 * delay))
@@ -0,0 +1,236 @@
+"""
+record_linkage.py
+
+This program links the players of two scraped files whose names are written differently,
+e.g. Transfermarkt "Vinícius Júnior" and Understat "Vinicius Jose Paixao de Oliveira Junior",
+or "Yann Sommer" and "Yan Sommer". The exact-name merge would keep them apart, and
+both rows would later be dropped by data_sort for their missing columns.
+
+It does the following steps:
+    1. Blocking: every player gets block keys, the Soundex code of each name part, within the
+       player's season when both files have a season column. Only players sharing a block key
+       are compared, so the work grows with the number of players, not with every pair of players.
+       Blocks larger than max_block_pairs (e.g. a very common first name) are skipped.
+    2. Scoring: each candidate pair gets a score between 0 and 1 from the name similarity,
+       plus team and birth year agreement when those columns are given. Teams are matched loosely
+       ("Bor. Dortmund" and "Borussia Dortmund"), and a different team counts neither way, as
+       Transfermarkt lists a player's current club. Pairs whose surnames (every name part but the
+       first) share no Soundex code score 0, so a shared first name alone never links two players.
+    3. Every player is linked to at most one player of the other file, best scores first,
+       and only above a threshold.
+    4. The link table (left_name, right_name, score) is written to a CSV that
+       merge_player_data.py uses to give the right file's players the left file's names.
+
+How to use:
+    $ python record_linkage.py transfermarkt_players_Bundesliga_22-23.csv Name understat_players_Bundesliga_2022-2023.csv player_name \
+          --left-team Team --right-team team_title --output links_tm_understat.csv
+
+Author: Marcos Wofford
+"""
+
+import argparse
+from difflib import SequenceMatcher
+
+import numpy as np
+import pandas as pd
+
+from merge_player_data import TEAM_MATCH, normalize_names, read_text_table, team_similarity
+from scrape_cache import season_end_year
+
+# Weight of each kind of evidence in the score, renormalized over the evidence available
+WEIGHTS = {"name": 0.7, "team": 0.15, "born": 0.15}
+
+# Soundex digit of every consonant, vowels and h/w/y have none
+SOUNDEX_CODES = {letter: str(digit) for digit, letters in enumerate(
+    ["", "bfpv", "cgjkqsxz", "dt", "l", "mn", "r"]) for letter in letters}
+
+def soundex(word):
+    """
+    Function to compute the Soundex code of a normalized name part, e.g. 'sommer' -> 'S560'.
+    Names that sound alike ('yan'/'yann', 'mbappe'/'mbape') get the same code.
+    """
+    letters = [c for c in word if c.isalpha()]
+    if not letters:
+        return ""
+
+    code = letters[0].upper()
+    previous = SOUNDEX_CODES.get(letters[0], "")
+    for letter in letters[1:]:
+        digit = SOUNDEX_CODES.get(letter, "")
+        if digit and digit != previous:
+            code += digit
+        # h and w do not separate two letters with the same code
+        if letter not in "hw":
+            previous = digit
+    return (code + "000")[:4]
+
+def name_codes(names, surname=False):
+    """
+    Function to find the Soundex codes of every part of every normalized name, or with surname
+    only of the parts after the first name (all parts of a one-part name like 'angelino').
+    Returns: A Series of frozensets of codes, each distinct name part encoded once.
+    """
+    # Parts are runs of letters, so 'mbappe-lottin' has the parts 'mbappe' and 'lottin'
+    parts = names.str.findall(r"[^\W\d_]+")
+    if surname:
+        parts = parts.map(lambda name_parts: name_parts[1:] or name_parts)
+    distinct = pd.unique(parts.explode().dropna())
+    codes = dict(zip(distinct, (soundex(part) for part in distinct)))
+    return parts.map(lambda name_parts: frozenset(codes[part] for part in name_parts if codes[part]))
+
+def birth_years(values):
+    """
+    Function to read birth years from a DOB column ('Oct 23, 1991', '1991-10-23') or a year column ('1991').
+    Returns: A float Series, nan where no year could be read.
+    """
+    values = pd.Series(values, dtype="string").str.strip()
+    years = pd.to_numeric(values, errors="coerce")
+    dates = pd.to_datetime(values.where(years.isna()), errors="coerce", format="mixed")
+    return years.fillna(dates.dt.year).astype(float)
+
+def prepare(table, name, team=None, born=None, season=None):
+    """
+    Function to build the linkage columns of one file: normalized name, name and surname codes,
+    team, birth year and season (as its end year, '22/23' and '2022/2023' -> '2023').
+    """
+    table = table.reset_index(drop=True)
+    names = table[name].str.strip()
+    players = pd.DataFrame({"raw_name": names, "name": normalize_names(names)})
+    players["codes"] = name_codes(players["name"])
+    players["surnames"] = name_codes(players["name"], surname=True)
+    players["team"] = normalize_names(table[team]) if team else pd.NA
+    players["born"] = birth_years(table[born]) if born else np.nan
+    if season:
+        distinct = pd.unique(table[season])
+        end_years = {value: season_end_year(value) for value in distinct}
+        players["season"] = table[season].map(lambda value: str(end_years[value]) if end_years[value] else pd.NA)
+    else:
+        players["season"] = pd.NA
+    return players
+
+def block_keys(players, by_season=False):
+    """
+    Function to list the (player, block key) pairs of a file: one per name code, within the season with by_season.
+    """
+    codes = players["codes"].explode().dropna()
+    keys = "name:" + codes
+    if by_season:
+        keys = (players["season"].reindex(codes.index) + "|" + keys).dropna()
+    return pd.DataFrame({"player": keys.index, "block": keys.to_numpy()})
+
+def candidate_pairs(left, right, max_block_pairs=10_000):
+    """
+    Function to find the pairs of players that share at least one block key.
+    Returns: A DataFrame of (left, right) row positions, each pair once.
+    """
+    # Players of different seasons are only kept apart when both files say which season a player is in
+    by_season = bool(left["season"].notna().any() and right["season"].notna().any())
+    left_keys, right_keys = block_keys(left, by_season), block_keys(right, by_season)
+
+    # Skip blocks that would compare too many pairs
+    pair_counts = left_keys["block"].value_counts().mul(right_keys["block"].value_counts(), fill_value=0)
+    small = pair_counts.index[(pair_counts > 0) & (pair_counts <= max_block_pairs)]
+    left_keys = left_keys[left_keys["block"].isin(small)]
+    right_keys = right_keys[right_keys["block"].isin(small)]
+
+    pairs = left_keys.merge(right_keys, on="block", suffixes=("_left", "_right"))
+    pairs = pairs[["player_left", "player_right"]].drop_duplicates()
+    return pairs.set_axis(["left", "right"], axis=1).reset_index(drop=True)
+
+def name_similarity(left_name, right_name, left_codes, right_codes):
+    """
+    Function to score two normalized names: the mean of their character similarity and the
+    share of the shorter name's parts that sound like a part of the other name.
+    """
+    ratio = SequenceMatcher(None, left_name, right_name).ratio()
+    shorter = min(len(left_codes), len(right_codes))
+    overlap = len(left_codes & right_codes) / shorter if shorter else 0.0
+    return (ratio + overlap) / 2
+
+def score_pairs(left, right, pairs):
+    """
+    Function to score every candidate pair.
+    Returns: The pairs with a 'score' column, a weighted mean of name, team and birth year agreement,
+    0 for pairs without a surname code in common.
+    """
+    l = left.iloc[pairs["left"]].reset_index(drop=True)
+    r = right.iloc[pairs["right"]].reset_index(drop=True)
+
+    name = np.fromiter((name_similarity(*values) for values in zip(l["name"], r["name"], l["codes"], r["codes"])),
+                       dtype=float, count=len(pairs))
+    evidence = {"name": (name, np.ones(len(pairs), dtype=bool))}
+
+    # Birth year counts where both players have one, the team only where the teams match
+    team = np.fromiter((team_similarity(*values) if pd.notna(values[0]) and pd.notna(values[1]) else 0.0
+                        for values in zip(l["team"], r["team"])), dtype=float, count=len(pairs))
+    evidence["team"] = (team, team >= TEAM_MATCH)
+    born_known = (l["born"].notna() & r["born"].notna()).to_numpy()
+    evidence["born"] = (((l["born"] - r["born"]).abs() <= 1).to_numpy(dtype=float), born_known)
+
+    total = np.zeros(len(pairs))
+    weight = np.zeros(len(pairs))
+    for kind, (agreement, known) in evidence.items():
+        total += np.where(known, WEIGHTS[kind] * agreement, 0.0)
+        weight += np.where(known, WEIGHTS[kind], 0.0)
+
+    surname = np.fromiter((bool(left_codes & right_codes) for left_codes, right_codes in zip(l["surnames"], r["surnames"])),
+                          dtype=bool, count=len(pairs))
+    return pairs.assign(score=np.where(surname, total / weight, 0.0))
+
+def one_to_one(scored, threshold):
+    """
+    Function to keep, best score first, each player's best link to a player not linked yet.
+    """
+    scored = scored[scored["score"] >= threshold].sort_values("score", ascending=False, kind="stable")
+    used_left, used_right, keep = set(), set(), []
+    for i, left_player, right_player in zip(scored.index, scored["left"], scored["right"]):
+        if left_player not in used_left and right_player not in used_right:
+            used_left.add(left_player)
+            used_right.add(right_player)
+            keep.append(i)
+    return scored.loc[keep]
+
+def link_players(left_table, left_name, right_table, right_name, left_team=None, right_team=None,
+                 left_born=None, right_born=None, threshold=0.75, max_block_pairs=10_000,
+                 left_season=None, right_season=None):
+    """
+    Function to link the players of two tables.
+    Returns: The link table with columns left_name, right_name and score, best links first.
+    """
+    left = prepare(left_table, left_name, left_team, left_born, left_season)
+    right = prepare(right_table, right_name, right_team, right_born, right_season)
+
+    pairs = candidate_pairs(left, right, max_block_pairs)
+    links = one_to_one(score_pairs(left, right, pairs), threshold)
+
+    return pd.DataFrame({
+        "left_name": left["raw_name"].iloc[links["left"]].to_numpy(),
+        "right_name": right["raw_name"].iloc[links["right"]].to_numpy(),
+        "score": links["score"].round(4).to_numpy(),
+    })
+
+def main():
+    parser = argparse.ArgumentParser(description="Link the players of two scraped files with differently written names.")
+    parser.add_argument("left", help="file whose names are kept (e.g. Transfermarkt)")
+    parser.add_argument("left_name", help="player name column of the left file")
+    parser.add_argument("right", help="file whose names are linked to the left file (e.g. Understat)")
+    parser.add_argument("right_name", help="player name column of the right file")
+    parser.add_argument("--left-team", default=None, help="team column of the left file")
+    parser.add_argument("--right-team", default=None, help="team column of the right file")
+    parser.add_argument("--left-born", default=None, help="date of birth or birth year column of the left file")
+    parser.add_argument("--right-born", default=None, help="date of birth or birth year column of the right file")
+    parser.add_argument("--left-season", default=None, help="season column of the left file, players are only linked within a season")
+    parser.add_argument("--right-season", default=None, help="season column of the right file")
+    parser.add_argument("--threshold", type=float, default=0.75, help="lowest score that is linked")
+    parser.add_argument("--max-block-pairs", type=int, default=10_000, help="largest block that is compared")
+    parser.add_argument("--output", default="links.csv", help="link table to write")
+    args = parser.parse_args()
+
+    links = link_players(read_text_table(args.left), args.left_name, read_text_table(args.right), args.right_name,
+                         args.left_team, args.right_team, args.left_born, args.right_born,
+                         args.threshold, args.max_block_pairs, args.left_season, args.right_season)
+    links.to_csv(args.output, index=False)
+    print(f"{len(links)} players linked, saved to {args.output}")
+
+if __name__ == "__main__":
+    main()
@@ -15,10 +15,13 @@ How to use:
 2. Run the script directly:
     $ python runScrapers.py
 
+   Or scrape a whole list of leagues and seasons without prompts (see scrape_jobs.example.json):
+    $ python runScrapers.py --config scrape_jobs.json
+
 3. Follow the prompts to:
    - Select which sources to scrape
    - Choose the league and season format, appropriate for each source
-   - Merge two scraped CSV files (Only Transfermarkt and Understat are used for demo purposes) 
+   - Merge two or more scraped CSV files (Only Transfermarkt and Understat are used for demo purposes) 
 
 Requirements:
 -------------
@@ -29,12 +32,50 @@ Requirements:
     - merge_player_data.py (defines interactive_merge function)
 
 - Output files will be saved in: ./data/
+- Scraped pages are cached in ./data/scrape_cache.sqlite, so a re-run only downloads
+  what is missing or belongs to the current season (see scrape_cache.py)
+- A batch run also writes ./data/run_manifest.json with the status, time and row count of every job
 
 """
 
 import os
 import re
+import sys
+import json
+import time
+import argparse
+import datetime
+import threading
+from concurrent.futures import ThreadPoolExecutor
 from merge_player_data import interactive_merge
+from rate_limit import HostRateLimiter
+from scrape_cache import ScrapeCache, season_is_closed
+
+# The storage formats are shared with the cleaning and kmeans stages in Helper_Functions
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'Helper_Functions'))
+from table_store import FORMAT_EXTENSIONS, infer_dtypes, write_table
+
+# Jobs of a source that may run at the same time in a batch, unless the config says otherwise.
+# A Transfermarkt job already scrapes its players on several threads.
+SOURCE_CONCURRENCY = {"fbref": 1, "transfermarkt": 1, "understat": 2}
+
+def load_batch_config(config_file):
+    """
+    Function to read a batch config file (JSON) with:
+        "settings": keyword arguments for RunScrapers (optional)
+        "concurrency": jobs per source that may run at once (optional)
+        "jobs": list of {"source": ..., "leagues": [...], "seasons": [...]}
+    Returns: The config dictionary, with every job checked.
+    """
+    with open(config_file) as f:
+        config = json.load(f)
+
+    for job in config.get("jobs", []):
+        if job.get("source") not in SOURCE_CONCURRENCY:
+            raise ValueError(f"Unknown source {job.get('source')!r}, expected one of {', '.join(SOURCE_CONCURRENCY)}")
+        if not job.get("leagues") or not job.get("seasons"):
+            raise ValueError(f"Job for {job['source']} needs 'leagues' and 'seasons'")
+    return config
 
 class RunScrapers:
     """
@@ -43,13 +84,37 @@ class RunScrapers:
     league and season and saves the results as CSV files.
     """
 
-    def __init__(self, max_players=10, output_dir="data"):
+    def __init__(self, max_players=10, output_dir="data", tm_workers=4, tm_requests_per_second=2.0,
+                 use_cache=True, cache_ttl=24 * 60 * 60, cache_max_bytes=2 * 1024 ** 3,
+                 tm_scheduled_refresh=False, tm_refresh_days=90, storage_format="csv"):
         """
-        Function to initialize the RunScrapers class with settings for output directory
-        and number of players to scrape for Transfermarkt.
+        Function to initialize the RunScrapers class with settings for output directory,
+        number of players to scrape for Transfermarkt, and how many Transfermarkt players
+        are scraped at once and how many requests per second are allowed.
+        With use_cache, scraped data is kept in output_dir/scrape_cache.sqlite; data of the
+        current season expires after cache_ttl seconds, the file is kept under cache_max_bytes.
+        Transfermarkt scrapes are checkpointed and resume where they stopped; checkpointed players of the
+        current season are scraped again after cache_ttl seconds, like the cache. With tm_scheduled_refresh,
+        players are scraped again once tm_refresh_days have passed since their "Value last updated" date or
+        their last scrape, whichever is later (a time-based schedule, it does not detect whether the value changed).
+        storage_format is "csv", "parquet" or "arrow" (the last two need pyarrow).
         """
         self.max_players = max_players
         self.output_dir = output_dir
+        self.tm_workers = tm_workers
+        self.tm_requests_per_second = tm_requests_per_second
+        # Shared by every Transfermarkt job, so jobs running at once stay under one limit per host
+        self.tm_rate_limiter = HostRateLimiter(tm_requests_per_second)
+        self.use_cache = use_cache
+        self.cache_ttl = cache_ttl
+        self.cache_max_bytes = cache_max_bytes
+        self.cache = None
+        self.cache_lock = threading.Lock()
+        self.tm_scheduled_refresh = tm_scheduled_refresh
+        self.tm_refresh_days = tm_refresh_days
+        if storage_format not in ("csv", "parquet", "arrow"):
+            raise ValueError(f"Unknown storage format {storage_format!r}, expected csv, parquet or arrow")
+        self.storage_format = storage_format
 
         # Lists of which leagues are available for each source
         self.fbref_leagues = ['Big 5 European Leagues Combined','ENG-Premier League', 
@@ -63,6 +128,18 @@ class RunScrapers:
         self.understat_leagues = ["EPL", "La Liga", "Bundesliga", "Serie A", "Ligue 1",
         "RFPL", "Primeira Liga", "Eredivisie", "Championship" ]
 
+    def get_cache(self):
+        """
+        Function to open the scrape cache on first use.
+        Returns: the ScrapeCache, or None if caching is turned off.
+        """
+        with self.cache_lock:
+            if self.use_cache and self.cache is None:
+                os.makedirs(self.output_dir, exist_ok=True)
+                self.cache = ScrapeCache(os.path.join(self.output_dir, "scrape_cache.sqlite"),
+                                         open_season_ttl=self.cache_ttl, max_bytes=self.cache_max_bytes)
+        return self.cache
+
     @staticmethod
     def sanitize(s):
         """
@@ -71,6 +148,27 @@ class RunScrapers:
         """
         return re.sub(r'[\\/:"*?<>|]+', '-', s)
 
+    def output_file(self, name, league, season):
+        """
+        Function to build the path of an output file for a league and season, e.g. data/understat_EPL_2022-2023.csv
+        """
+        extension = FORMAT_EXTENSIONS[self.storage_format]
+        return f"{self.output_dir}/{name}_{self.sanitize(league)}_{self.sanitize(season)}{extension}"
+
+    def save(self, df, name, league, season):
+        """
+        Function to save a scraped DataFrame in the storage format.
+        Columns of mixed text and numbers (common in scraped tables) are stored as text in columnar files,
+        FBref's two header rows become one 'group_stat' column name.
+        """
+        if self.storage_format != "csv":
+            if df.columns.nlevels > 1:
+                df = df.set_axis(["_".join(str(level) for level in column if level) for column in df.columns], axis=1)
+            df = infer_dtypes(df)
+            mixed = [column for column in df.columns if df[column].dtype == object]
+            df[mixed] = df[mixed].astype("string")
+        write_table(df, self.output_file(name, league, season))
+
     def run_fbref_only(self, league, season):
         """
         Run the FBref scraper for a single league and season.
@@ -83,17 +181,16 @@ class RunScrapers:
         fbref_scraper = FBrefDataScraper()
         fbref_scraper.league = league
         fbref_scraper.seasons = [season]
+        fbref_scraper.cache = self.get_cache()
         fbref_scraper.initialize_scraper()
 
         # Scraping player, team, and schedule data
         players, teams, schedule = fbref_scraper.scrape_all_data()
 
         # Saving results as CSV
-        safe_league = self.sanitize(league)
-        safe_season = self.sanitize(season)
-        players.to_csv(f"{self.output_dir}/fbref_players_{safe_league}_{safe_season}.csv", index=False)
-        teams.to_csv(f"{self.output_dir}/fbref_teams_{safe_league}_{safe_season}.csv", index=False)
-        schedule.to_csv(f"{self.output_dir}/fbref_schedule_{safe_league}_{safe_season}.csv", index=False)
+        self.save(players, "fbref_players", league, season)
+        self.save(teams, "fbref_teams", league, season)
+        self.save(schedule, "fbref_schedule", league, season)
         print("FBref data saved")
 
         return players
@@ -106,10 +203,19 @@ class RunScrapers:
         from scraper_transfermarkt import TransfermarktDataScraper
         os.makedirs(self.output_dir, exist_ok=True)
 
-        # Setting up scraper
-        tm_scraper = TransfermarktDataScraper(max_players=self.max_players)
+        safe_league = self.sanitize(league)
+        safe_season = self.sanitize(season)
+
+        # Setting up scraper, every scraped player is saved to the checkpoint file right away;
+        # players of a season still being played expire from it like the cache entries do
+        tm_scraper = TransfermarktDataScraper(max_players=self.max_players, workers=self.tm_workers,
+                                              rate_limiter=self.tm_rate_limiter,
+                                              checkpoint_file=f"{self.output_dir}/transfermarkt_{safe_league}_{safe_season}.checkpoint.jsonl",
+                                              scheduled_refresh=self.tm_scheduled_refresh, refresh_days=self.tm_refresh_days,
+                                              checkpoint_ttl=None if season_is_closed(season) else self.cache_ttl)
         tm_scraper.league = league
         tm_scraper.season = season
+        tm_scraper.cache = self.get_cache()
         tm_scraper.initialize_scraper()
 
         # Scraping and save player data
@@ -117,9 +223,7 @@ class RunScrapers:
         df["source"] = "transfermarkt"
 
         # Saving CSV
-        safe_league = self.sanitize(league)
-        safe_season = self.sanitize(season)
-        df.to_csv(f"{self.output_dir}/transfermarkt_{safe_league}_{safe_season}.csv", index=False)
+        self.save(df, "transfermarkt", league, season)
         print("Transfermarkt data saved")
 
         return df
@@ -136,6 +240,7 @@ class RunScrapers:
         us_scraper = UnderstatDataScraper()
         us_scraper.league = league
         us_scraper.season = season
+        us_scraper.cache = self.get_cache()
         us_scraper.initialize_scraper()
 
         # Scraping and save player data
@@ -143,9 +248,7 @@ class RunScrapers:
         df["source"] = "understat"
 
         # Saving CSV
-        safe_league = self.sanitize(league)
-        safe_season = self.sanitize(season)
-        df.to_csv(f"{self.output_dir}/understat_{safe_league}_{safe_season}.csv", index=False)
+        self.save(df, "understat", league, season)
         print("Understat data saved")
 
         return df
@@ -190,8 +293,70 @@ class RunScrapers:
         # Returning all dataframes 
         return fbref_df, tm_df, us_df
 
+    def run_job(self, source, league, season):
+        """
+        Function to run one scraper job of a batch and time it.
+        A failing job is recorded instead of stopping the batch.
+        Returns: A manifest entry with the status, timings, row count and output file of the job.
+        """
+        run = {"fbref": self.run_fbref_only, "transfermarkt": self.run_transfermarkt_only,
+               "understat": self.run_understat_only}[source]
+        entry = {"source": source, "league": league, "season": season,
+                 "output": self.output_file("fbref_players" if source == "fbref" else source, league, season),
+                 "started": datetime.datetime.now().isoformat(timespec="seconds")}
+        start = time.perf_counter()
+        try:
+            df = run(league, season)
+            entry.update(status="ok", rows=len(df))
+        except Exception as e:
+            entry.update(status="failed", rows=0, error=f"{type(e).__name__}: {e}")
+        entry["seconds"] = round(time.perf_counter() - start, 2)
+        return entry
+
+    def run_batch(self, config):
+        """
+        Function to run every source x league x season job of a batch config without prompts.
+        Jobs run at the same time, up to the concurrency limit of their source.
+        Writes the run manifest to output_dir/run_manifest.json.
+        Returns: The manifest dictionary.
+        """
+        jobs = [(job["source"], league, season)
+                for job in config.get("jobs", []) for league in job["leagues"] for season in job["seasons"]]
+        limits = {**SOURCE_CONCURRENCY, **config.get("concurrency", {})}
+        for source, limit in limits.items():
+            if not isinstance(limit, int) or limit < 1:
+                raise ValueError(f"Concurrency of {source} must be a whole number of at least 1, not {limit!r}")
+
+        # One pool per source, so jobs waiting for a busy source never hold up the other sources
+        manifest = {"started": datetime.datetime.now().isoformat(timespec="seconds")}
+        start = time.perf_counter()
+        pools = {source: ThreadPoolExecutor(max_workers=limit) for source, limit in limits.items()}
+        try:
+            futures = [pools[job[0]].submit(self.run_job, *job) for job in jobs]
+            manifest["jobs"] = [future.result() for future in futures]
+        finally:
+            for pool in pools.values():
+                pool.shutdown()
+        manifest["seconds"] = round(time.perf_counter() - start, 2)
+        manifest["rows"] = sum(entry["rows"] for entry in manifest["jobs"])
+        manifest["failed"] = sum(entry["status"] != "ok" for entry in manifest["jobs"])
+
+        os.makedirs(self.output_dir, exist_ok=True)
+        with open(f"{self.output_dir}/run_manifest.json", "w") as f:
+            json.dump(manifest, f, indent=2)
+        print(f"{len(jobs)} jobs done in {manifest['seconds']}s, {manifest['failed']} failed, {manifest['rows']} rows")
+        return manifest
+
 
 if __name__ == "__main__":
-    runner = RunScrapers()
-    runner.run_interactive()
-    runner.run_merge()
+    parser = argparse.ArgumentParser(description="Scrape player data interactively, or in a batch from a config file.")
+    parser.add_argument("--config", default=None, help="JSON file of scraper jobs to run without prompts")
+    args = parser.parse_args()
+
+    if args.config:
+        config = load_batch_config(args.config)
+        RunScrapers(**config.get("settings", {})).run_batch(config)
+    else:
+        runner = RunScrapers()
+        runner.run_interactive()
+        runner.run_merge()
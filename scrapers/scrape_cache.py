@@ -0,0 +1,157 @@
+"""
+scrape_cache.py
+
+This program defines an on-disk cache for the scraper classes, so re-running the pipeline
+does not download data that has not changed.
+
+Payloads (DataFrames, dictionaries of DataFrames, lists of links) are stored in a local
+SQLite file, keyed by (source, league, season, entity), e.g.
+    ("transfermarkt", "Bundesliga", "22/23", "<player link>")
+    ("understat", "Bundesliga", "2022/2023", "all_teams")
+
+- Closed seasons never expire, their data does not change any more.
+- Entries of the current season expire after `open_season_ttl` seconds and are fetched again.
+- When the file grows past `max_bytes`, the least recently used entries are removed.
+
+The ScraperFC and soccerdata backends do not expose their HTTP requests, so an expired
+entry is simply fetched again rather than revalidated with a conditional request.
+
+Author: Marcos Wofford
+"""
+
+import datetime
+import pickle
+import re
+import sqlite3
+import threading
+import time
+
+# Month after which a season that ends in a given year counts as finished
+SEASON_END_MONTH = 7
+
+def season_end_year(season):
+    """
+    Function to find the calendar year a season ends in, from the formats the scrapers use:
+    '22/23', '22-23', '2022/2023', '2022-2023' or a single year like '2024' (MLS).
+    Returns: the end year as an int, or None if the format is not recognized.
+    """
+    years = re.findall(r'\d+', str(season))
+    if not years:
+        return None
+    year = int(years[-1])
+    return year + 2000 if year < 100 else year
+
+def season_is_closed(season, today=None):
+    """
+    Function to check whether a season is over, so its data can no longer change.
+    Split seasons ('22/23') are over after June of the end year, single years after that year.
+    """
+    today = today or datetime.date.today()
+    end_year = season_end_year(season)
+    if end_year is None:
+        return False
+    if len(re.findall(r'\d+', str(season))) > 1:
+        return (today.year, today.month) >= (end_year, SEASON_END_MONTH)
+    return today.year > end_year
+
+class ScrapeCache:
+    """
+    A SQLite backed cache of scraped payloads, safe to share between threads.
+    """
+
+    def __init__(self, path, open_season_ttl=24 * 60 * 60, max_bytes=2 * 1024 ** 3, clock=time.time):
+        """
+        Function to open (or create) the cache file.
+
+        Parameters: path (str): SQLite file.
+                    open_season_ttl (float): seconds before an entry of an unfinished season expires.
+                    max_bytes (int or None): largest total payload size kept, None for no limit.
+                    clock: time function, replaceable for testing.
+        """
+        self.path = path
+        self.open_season_ttl = open_season_ttl
+        self.max_bytes = max_bytes
+        self.clock = clock
+        self.lock = threading.Lock()
+        self.connection = sqlite3.connect(path, check_same_thread=False)
+        with self.lock, self.connection:
+            self.connection.execute(
+                "CREATE TABLE IF NOT EXISTS payloads ("
+                " source TEXT, league TEXT, season TEXT, entity TEXT,"
+                " payload BLOB, size INTEGER, expires_at REAL, last_access REAL,"
+                " PRIMARY KEY (source, league, season, entity))"
+            )
+
+    def get(self, source, league, season, entity):
+        """
+        Function to look up a payload.
+        Returns: (True, payload) for a fresh entry, (False, None) if missing or expired.
+        """
+        key = (source, str(league), str(season), str(entity))
+        now = self.clock()
+        with self.lock:
+            row = self.connection.execute(
+                "SELECT payload, expires_at FROM payloads WHERE source=? AND league=? AND season=? AND entity=?", key
+            ).fetchone()
+            if row is None or (row[1] is not None and row[1] <= now):
+                return False, None
+            with self.connection:
+                self.connection.execute(
+                    "UPDATE payloads SET last_access=? WHERE source=? AND league=? AND season=? AND entity=?", (now,) + key
+                )
+        return True, pickle.loads(row[0])
+
+    def put(self, source, league, season, entity, payload):
+        """
+        Function to store a payload, with no expiry for closed seasons.
+        """
+        key = (source, str(league), str(season), str(entity))
+        data = pickle.dumps(payload, protocol=pickle.HIGHEST_PROTOCOL)
+        now = self.clock()
+        expires_at = None if season_is_closed(season) else now + self.open_season_ttl
+        with self.lock, self.connection:
+            self.connection.execute(
+                "INSERT OR REPLACE INTO payloads VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                key + (sqlite3.Binary(data), len(data), expires_at, now)
+            )
+            self.evict()
+
+    def evict(self):
+        """
+        Function to remove expired entries, then the least recently used ones while the cache is too big.
+        Called with the lock held.
+        """
+        self.connection.execute("DELETE FROM payloads WHERE expires_at IS NOT NULL AND expires_at <= ?", (self.clock(),))
+        if self.max_bytes is None:
+            return
+        total = self.connection.execute("SELECT COALESCE(SUM(size), 0) FROM payloads").fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        rows = self.connection.execute("SELECT rowid, size FROM payloads ORDER BY last_access").fetchall()
+        for rowid, size in rows:
+            if total <= self.max_bytes:
+                break
+            self.connection.execute("DELETE FROM payloads WHERE rowid=?", (rowid,))
+            total -= size
+
+    def get_or_fetch(self, source, league, season, entity, fetch, refresh=False):
+        """
+        Function to return the cached payload, or call fetch() and cache its result.
+        With refresh, the cached payload is ignored and replaced by a new fetch.
+        Failed fetches (exceptions) and None results are not cached.
+        """
+        if not refresh:
+            found, payload = self.get(source, league, season, entity)
+            if found:
+                return payload
+        payload = fetch()
+        if payload is not None:
+            self.put(source, league, season, entity, payload)
+        return payload
+
+    def close(self):
+        """
+        Function to close the cache file.
+        """
+        with self.lock:
+            self.connection.close()
@@ -1,125 +1,293 @@
-"""
-scraper_transfermarkt.py
-
-This program defines a class for scraping player data from Transfermarkt using the ScraperFC library.
-It supports scraping specific leagues and seasons, with an optional limit on the number of players.
-The data is collected into a pandas DataFrame for analysis.
-The class provides progress feedback using tqdm.
-
-Author: Marcos Wofford
-
-"""
-
-
-
-import os
-import pandas as pd
-from ScraperFC.transfermarkt import Transfermarkt
-from tqdm import tqdm
-import re
-
-class TransfermarktDataScraper:
-    """
-    A class to scrape player data from Transfermarkt using the ScraperFC library.
-    """
-
-    # Supported leagues by this scraper
-    VALID_LEAGUES = [
-        'EPL', 'EFL Championship', 'EFL1', 'EFL2', 'Bundesliga', '2.Bundesliga',
-        'Serie A', 'Serie B', 'La Liga', 'La Liga 2', 'Ligue 1', 'Ligue 2',
-        'Eredivisie', 'Scottish PL', 'Super Lig', 'Turkish Super Lig',
-        'Jupiler Pro League', 'Liga Nos', 'Russian Premier League',
-        'Brasileirao', 'Argentina Liga Profesional', 'MLS',
-        'Primavera 1', 'Primavera 2 - A', 'Primavera 2 - B', 'Campionato U18'
-    ]
-
-    def __init__(self, max_players=None):
-        """
-        Function to initialize the TransfermarktDataScraper.
-
-        Parameters: max_players (int or None): limit on the number of players to scrape.
-        """
-        self.max_players = max_players  # How many players to scrape (None = all)
-        self.league = None              # League to scrape ('EPL')
-        self.season = None              # Season to scrape ('22/23')
-        self.scraper = None             # Instance of the Transfermarkt scraper
-
-    def initialize_scraper(self):
-        """
-        Function to create an instance of the Transfermarkt scraper from ScraperFC.
-        """
-        if not self.scraper:
-            try:
-                self.scraper = Transfermarkt()
-            except Exception as e:
-                raise RuntimeError(f"Failed to initialize Transfermarkt scraper: {e}")
-
-    def get_player_links(self):
-        """
-        Function to fetch player profile URLs for the given league and season.
-        Returns: A list of player profile links (limited by max_players if set).
-        """
-        if not self.scraper or not self.league or not self.season:
-            raise ValueError("Initialize scraper and set league/season first")
-
-        try:
-            # Returning the list of player URLs from Transfermarkt
-            return self.scraper.get_player_links(self.season, self.league)[:self.max_players]
-        except Exception as e:
-            print(f"Error fetching player links for {self.league} {self.season}: {e}")
-            return []
-
-    def scrape_single_player(self, player_link):
-        """
-        Function to scrape a single player's data.
-        Returns: A pandas DataFrame with player data, or None if scraping failed.
-        """
-        try:
-            return self.scraper.scrape_player(player_link)
-        except Exception as e:
-            # Skip player if scraping fails
-            return None  
-
-    def scrape_players(self):
-        """
-        Function to scrape all players from the selected league and season.
-        Returns: A combined pandas DataFrame with all player data, or an empty DataFrame if none were scraped.
-        """
-        try:
-            self.initialize_scraper()
-        except Exception as e:
-            print(f"Could not initialize scraper: {e}")
-            return pd.DataFrame()
-
-        # Getting all the player URLs
-        player_links = self.get_player_links()
-
-        if not player_links:
-            print("No player links found. Exiting scrape.")
-            return pd.DataFrame()
-
-        # List of all player DataFrames
-        all_players = []  
-
-        # Looping through each player link and scrape the data
-        for link in tqdm(player_links, desc="Transfermarkt scraping"):
-            try:
-                player_data = self.scrape_single_player(link)
-                if player_data is not None:
-                    all_players.append(player_data)
-            except Exception as e:
-                # Continuing even if one player fails
-                continue  
-
-        # Combining all player DataFrames into one
-        if all_players:
-            return pd.concat(all_players, ignore_index=True)
-
-        # Empty DataFrame if no players scraped successfully
-        return pd.DataFrame()
-
-    def scrape_and_save_players(self):
-        """
-        Function to scrape all players and return the DataFrame.
-        """
-        return self.scrape_players()
+"""
+scraper_transfermarkt.py
+
+This program defines a class for scraping player data from Transfermarkt using the ScraperFC library.
+It supports scraping specific leagues and seasons, with an optional limit on the number of players.
+The data is collected into a pandas DataFrame for analysis.
+The class provides progress feedback using tqdm.
+Players can be scraped by several worker threads at once; requests are rate limited per host
+and failed players are retried with exponential backoff (see rate_limit.py).
+Player links and player pages can be kept in an on-disk cache (see scrape_cache.py).
+With a checkpoint file, every scraped player is appended to disk as soon as it arrives, so a scrape
+that stops halfway resumes where it stopped. Entries older than checkpoint_ttl are ignored, so the data of
+a season still being played does not go stale. With scheduled_refresh, players already in the checkpoint
+are scraped again refresh_days after their "Value last updated" date or their last scrape, whichever is later.
+This is a time-based schedule: the player links carry no valuation date, so whether a value actually
+changed is only known after the player page is fetched again.
+
+Author: Marcos Wofford
+
+"""
+
+
+
+import os
+import json
+import datetime
+import pandas as pd
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from ScraperFC.transfermarkt import Transfermarkt
+from tqdm import tqdm
+import re
+
+from rate_limit import HostRateLimiter, call_with_retries
+
+class TransfermarktDataScraper:
+    """
+    A class to scrape player data from Transfermarkt using the ScraperFC library.
+    """
+
+    # Supported leagues by this scraper
+    VALID_LEAGUES = [
+        'EPL', 'EFL Championship', 'EFL1', 'EFL2', 'Bundesliga', '2.Bundesliga',
+        'Serie A', 'Serie B', 'La Liga', 'La Liga 2', 'Ligue 1', 'Ligue 2',
+        'Eredivisie', 'Scottish PL', 'Super Lig', 'Turkish Super Lig',
+        'Jupiler Pro League', 'Liga Nos', 'Russian Premier League',
+        'Brasileirao', 'Argentina Liga Profesional', 'MLS',
+        'Primavera 1', 'Primavera 2 - A', 'Primavera 2 - B', 'Campionato U18'
+    ]
+
+    # Column of the date Transfermarkt last changed a player's market value
+    VALUE_UPDATED_COLUMN = 'Value last updated'
+
+    def __init__(self, max_players=None, workers=1, requests_per_second=2.0, max_retries=3, backoff=1.0,
+                 checkpoint_file=None, scheduled_refresh=False, refresh_days=90, rate_limiter=None, checkpoint_ttl=None):
+        """
+        Function to initialize the TransfermarktDataScraper.
+
+        Parameters: max_players (int or None): limit on the number of players to scrape.
+                    workers (int): number of threads scraping players at the same time.
+                    requests_per_second (float): request limit per host, shared by all workers.
+                    max_retries (int): retries for a player whose scrape fails.
+                    backoff (float): seconds before the first retry, doubled on every retry.
+                    checkpoint_file (str or None): JSON lines file of scraped players, None = keep in memory only.
+                    scheduled_refresh (bool): scrape players in the checkpoint again once refresh_days have passed since their value date or last scrape.
+                    refresh_days (int): days after "Value last updated" (or the last scrape, if later) that a new valuation is expected.
+                    rate_limiter (HostRateLimiter or None): limiter shared with other scrapers, None = a new one at requests_per_second.
+                    checkpoint_ttl (float or None): seconds after which a checkpoint entry is scraped again, None = never.
+        """
+        self.max_players = max_players  # How many players to scrape (None = all)
+        self.league = None              # League to scrape ('EPL')
+        self.season = None              # Season to scrape ('22/23')
+        self.scraper = None             # Instance of the Transfermarkt scraper (can be set to a stub)
+        self.workers = workers
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.rate_limiter = rate_limiter or HostRateLimiter(requests_per_second)
+        self.cache = None               # Optional ScrapeCache, None = always download
+        self.checkpoint_file = checkpoint_file
+        self.checkpoint_ttl = checkpoint_ttl
+        self.scheduled_refresh = scheduled_refresh
+        self.refresh_days = refresh_days
+
+    def initialize_scraper(self):
+        """
+        Function to create an instance of the Transfermarkt scraper from ScraperFC.
+        """
+        if not self.scraper:
+            try:
+                self.scraper = Transfermarkt()
+            except Exception as e:
+                raise RuntimeError(f"Failed to initialize Transfermarkt scraper: {e}")
+
+    def get_player_links(self):
+        """
+        Function to fetch player profile URLs for the given league and season.
+        Returns: A list of player profile links (limited by max_players if set).
+        """
+        if not self.scraper or not self.league or not self.season:
+            raise ValueError("Initialize scraper and set league/season first")
+
+        try:
+            # Returning the list of player URLs from Transfermarkt
+            if self.cache:
+                links = self.cache.get_or_fetch("transfermarkt", self.league, self.season, "player_links",
+                                                lambda: self.scraper.get_player_links(self.season, self.league))
+            else:
+                links = self.scraper.get_player_links(self.season, self.league)
+            return links[:self.max_players]
+        except Exception as e:
+            print(f"Error fetching player links for {self.league} {self.season}: {e}")
+            return []
+
+    def fetch_player(self, player_link):
+        """
+        Function to make one rate limited request for a player's data.
+        """
+        self.rate_limiter.acquire(player_link)
+        return self.scraper.scrape_player(player_link)
+
+    def scrape_single_player(self, player_link, refresh=False):
+        """
+        Function to scrape a single player's data, retrying with exponential backoff.
+        Cached players are returned without a request, unless refresh is set.
+        Returns: A pandas DataFrame with player data, or None if scraping failed.
+        """
+        fetch = lambda: call_with_retries(lambda: self.fetch_player(player_link), self.max_retries, self.backoff)
+        try:
+            if self.cache:
+                return self.cache.get_or_fetch("transfermarkt", self.league, self.season, player_link, fetch, refresh)
+            return fetch()
+        except Exception as e:
+            # Skip player if scraping fails
+            return None  
+
+    def load_checkpoint(self, now=None):
+        """
+        Function to read the players saved in the checkpoint file.
+        A line cut off by a crash is ignored; if a player was saved twice, the newest line wins.
+        Players scraped more than checkpoint_ttl seconds ago are left out, so they are scraped again.
+        Returns: A dictionary of player link -> {'scraped_at': timestamp string, 'rows': list of row dictionaries}.
+        """
+        done = {}
+        if not self.checkpoint_file or not os.path.exists(self.checkpoint_file):
+            return done
+
+        with open(self.checkpoint_file, encoding='utf-8') as f:
+            for line in f:
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    continue
+                done[entry['link']] = entry
+
+        if self.checkpoint_ttl is not None:
+            expired = pd.Timestamp(now or datetime.datetime.now()) - pd.Timedelta(seconds=self.checkpoint_ttl)
+            done = {link: entry for link, entry in done.items() if pd.Timestamp(entry['scraped_at']) > expired}
+        return done
+
+    def save_checkpoint(self, f, player_link, player_data):
+        """
+        Function to append one scraped player to the open checkpoint file and flush it to disk.
+        Returns: The checkpoint entry of the player.
+        """
+        entry = {
+            'link': player_link,
+            'scraped_at': datetime.datetime.now().isoformat(timespec='seconds'),
+            'rows': player_data.to_dict('records')
+        }
+        f.write(json.dumps(entry, default=str) + '\n')
+        f.flush()
+        os.fsync(f.fileno())
+        return entry
+
+    def needs_refresh(self, entry, today=None):
+        """
+        Function to check if a saved player is due to be scraped again with scheduled_refresh.
+        A time-based heuristic, not change detection: a new valuation is expected refresh_days after
+        "Value last updated", or after the last scrape if that is later, so a player whose value did not
+        change is checked again every refresh_days.
+        """
+        today = pd.Timestamp(today or datetime.date.today())
+        scraped_at = pd.Timestamp(entry['scraped_at'])
+        rows = entry['rows']
+        updated = pd.to_datetime(rows[0].get(self.VALUE_UPDATED_COLUMN) if rows else None, errors='coerce')
+
+        # Without a valuation date, fall back to the age of the scrape
+        if pd.isna(updated) or updated < scraped_at:
+            updated = scraped_at
+
+        return updated + pd.Timedelta(days=self.refresh_days) <= today
+
+    def scrape_players(self):
+        """
+        Function to scrape all players from the selected league and season.
+        With a checkpoint file, players already saved are skipped (or refreshed when due with scheduled_refresh).
+        Returns: A combined pandas DataFrame with all player data, or an empty DataFrame if none were scraped.
+        """
+        try:
+            self.initialize_scraper()
+        except Exception as e:
+            print(f"Could not initialize scraper: {e}")
+            return pd.DataFrame()
+
+        # Getting all the player URLs
+        player_links = self.get_player_links()
+
+        if not player_links:
+            print("No player links found. Exiting scrape.")
+            return pd.DataFrame()
+
+        if not self.checkpoint_file:
+            return self.combine(self.scrape_links(player_links))
+
+        # Resuming from the checkpoint, only missing (or outdated) players are scraped
+        done = self.load_checkpoint()
+        refresh = {link for link in player_links if link in done and self.scheduled_refresh and self.needs_refresh(done[link])}
+        todo = [link for link in player_links if link not in done or link in refresh]
+        if done:
+            print(f"Checkpoint has {len(done)} players, scraping {len(todo)} ({len(refresh)} due for a refresh)")
+
+        os.makedirs(os.path.dirname(self.checkpoint_file) or '.', exist_ok=True)
+        with open(self.checkpoint_file, 'a+', encoding='utf-8') as f:
+            # A crash can leave half a line at the end, start on a new line after it
+            if f.tell() > 0:
+                f.seek(f.tell() - 1)
+                if f.read(1) != '\n':
+                    f.write('\n')
+
+            def on_player(link, player_data):
+                done[link] = self.save_checkpoint(f, link, player_data)
+
+            self.scrape_links(todo, refresh, on_player)
+
+        # Rebuilding the players in the order of the links from the checkpoint
+        rows = [row for link in player_links if link in done for row in done[link]['rows']]
+        return pd.DataFrame(rows)
+
+    def scrape_links(self, player_links, refresh=(), on_player=None):
+        """
+        Function to scrape a list of player links, on several threads if workers > 1.
+        on_player(link, player_data) is called on this thread for every player that was scraped.
+        Returns: The player DataFrames in the order of the links, None where scraping failed.
+        """
+        results = [None] * len(player_links)
+
+        def collect(i, player_data):
+            results[i] = player_data
+            if player_data is not None and on_player:
+                on_player(player_links[i], player_data)
+
+        if self.workers > 1:
+            # Scraping several players at once, the rate limiter keeps the request rate down
+            with ThreadPoolExecutor(max_workers=self.workers) as pool:
+                futures = {pool.submit(self.scrape_single_player, link, link in refresh): i
+                           for i, link in enumerate(player_links)}
+                for future in tqdm(as_completed(futures), total=len(futures), desc="Transfermarkt scraping"):
+                    try:
+                        collect(futures[future], future.result())
+                    except Exception as e:
+                        # Continuing even if one player fails
+                        continue
+        else:
+            # Looping through each player link and scrape the data
+            for i, link in enumerate(tqdm(player_links, desc="Transfermarkt scraping")):
+                try:
+                    collect(i, self.scrape_single_player(link, link in refresh))
+                except Exception as e:
+                    # Continuing even if one player fails
+                    continue  
+
+        return results
+
+    @staticmethod
+    def combine(results):
+        """
+        Function to combine the scraped player DataFrames into one.
+        Returns: A pandas DataFrame with all players, or an empty DataFrame if none were scraped.
+        """
+        # List of all player DataFrames
+        all_players = [player_data for player_data in results if player_data is not None]
+
+        # Combining all player DataFrames into one
+        if all_players:
+            return pd.concat(all_players, ignore_index=True)
+
+        # Empty DataFrame if no players scraped successfully
+        return pd.DataFrame()
+
+    def scrape_and_save_players(self):
+        """
+        Function to scrape all players and return the DataFrame.
+        """
+        return self.scrape_players()
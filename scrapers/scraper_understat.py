@@ -3,6 +3,7 @@ scraper_understat.py
 
 This program defines a class for scraping team and player xG/xA data from Understat using the ScraperFC library.
 It supports scraping specific leagues and seasons, returning structured player-level data in a pandas DataFrame.
+The team data of a league and season can be kept in an on-disk cache (see scrape_cache.py).
 
 Author: Marcos Wofford
 """
@@ -31,6 +32,7 @@ class UnderstatDataScraper:
         self.league = None    
         self.season = None   
         self.scraper = None    
+        self.cache = None     # Optional ScrapeCache, None = always download
 
     def initialize_scraper(self):
         """
@@ -48,11 +50,14 @@ class UnderstatDataScraper:
         if not self.scraper or not self.league or not self.season:
             raise ValueError("Initialize scraper and set league/season first")
 
-        return self.scraper.scrape_all_teams_data(
+        fetch = lambda: self.scraper.scrape_all_teams_data(
             year=self.season,
             league=self.league,
             as_df=True 
         )
+        if self.cache:
+            return self.cache.get_or_fetch("understat", self.league, self.season, "all_teams", fetch)
+        return fetch()
 
     def extract_players_data(self, all_teams_data):
         """